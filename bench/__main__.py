@@ -0,0 +1,192 @@
+import sys
+import io
+import os
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from lib import gcan, gdat, ld
+from bench import generate
+
+# python -m bench [--size MB] [--channels N] [--rates HZ,HZ,...] [--escape-density F] [--seed N] [--repeat N]
+# e.g. python -m bench --size 50 --channels 100
+# generates a synthetic .gdat file (cached in bench/data/) and times each stage of converting it to .ld:
+#   decode, sort, rate calculation, resample, encode, ld.write, and ld.parse
+# each stage's best time over --repeat runs is recorded with its throughput (MB/s of .gdat data) and
+# the process's peak RSS to bench/history.json, and compared to the last run with the same settings
+
+BENCH_DIR = Path(__file__).parent
+DATA_DIR = BENCH_DIR / 'data'
+HISTORY_PATH = BENCH_DIR / 'history.json'
+CONFIG_PATH = BENCH_DIR.parent / 'lib' / 'go4-24e.yaml'
+
+STAGES = ('decode', 'sort', 'sample_rate', 'resample', 'encode', 'ld_write', 'ld_parse')
+REGRESSION_THRESHOLD = 0.10 # flag stages more than 10% slower than the last matching run
+
+# peak resident set size of this process in MB, None where the resource module is unavailable (Windows)
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+# run every stage once on the data portion of a .gdat file
+# returns ({stage: seconds}, {stage: peak RSS in MB after the stage})
+def run_stages(data, parameters, t0, ld_path, mode):
+    times = {}
+    peaks = {}
+
+    def timed(stage, fn):
+        start = time.perf_counter()
+        result = fn()
+        times[stage] = time.perf_counter() - start
+        peaks[stage] = peak_rss_mb()
+        return result
+
+    # silence the library's progress and warning prints while timing
+    with contextlib.redirect_stdout(io.StringIO()):
+        points, _, _ = timed('decode', lambda: gdat.decode(data, parameters))
+        channels = {id: gdat.new_channel(id, param, points[id]) for (id, param) in parameters.items() if id in points}
+        timed('sort', lambda: [gdat.sort_points(ch) for ch in channels.values()])
+        timed('sample_rate', lambda: [gdat.set_sample_rate(ch) for ch in channels.values()])
+        timed('resample', lambda: [gdat.fit_time_axis(ch, mode) for ch in channels.values()])
+        encoded = timed('encode', lambda: [gdat.encode_channel(ch) for ch in channels.values()])
+        channels = {id: ch for ((id, ch), ok) in zip(channels.items(), encoded) if ok}
+        timed('ld_write', lambda: ld.write(ld_path, channels, t0))
+        timed('ld_parse', lambda: ld.parse(ld_path))
+    return (times, peaks)
+
+# settings that identify comparable runs
+def run_key(run):
+    return (run['generator'], run['mode'])
+
+def load_history():
+    if not HISTORY_PATH.is_file():
+        return []
+    with open(HISTORY_PATH) as f:
+        return json.load(f)
+
+def save_history(history):
+    with open(HISTORY_PATH, 'w') as f:
+        json.dump(history, f, indent=2)
+
+def print_results(run, previous):
+    print(f"{'stage':<12} {'seconds':>9} {'MB/s':>9} {'peak MB':>9}   vs {previous['commit'] if previous else '-'}")
+    for stage in STAGES:
+        result = run['stages'][stage]
+        line = f"{stage:<12} {result['seconds']:>9.3f} {result['mb_per_s']:>9.1f} {str(result['peak_rss_mb']):>9}"
+        if previous is not None and stage in previous['stages']:
+            change = result['seconds'] / previous['stages'][stage]['seconds'] - 1
+            line += f'   {change:+.1%}'
+            if change > REGRESSION_THRESHOLD:
+                line += '  REGRESSION'
+        print(line)
+    print(f"{'total':<12} {run['total_s']:>9.3f} {run['total_mb_per_s']:>9.1f} {str(run['peak_rss_mb']):>9}")
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench', description='benchmark .gdat parsing and .ld conversion')
+    parser.add_argument('--size', type=float, default=20, help='size of the generated .gdat file in MB (default 20)')
+    parser.add_argument('--channels', type=int, default=50, help='number of channels to generate (default 50)')
+    parser.add_argument('--rates', default=','.join(str(r) for r in generate.RATES_HZ), help='channel rates in Hz, assigned to channels in turn')
+    parser.add_argument('--escape-density', type=float, default=generate.ESCAPE_DENSITY, help='fraction of packets with a byte to escape')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best time is recorded (default 3)')
+    parser.add_argument('--mode', choices=gdat.RESAMPLE_MODES, default=gdat.RESAMPLE_MODE)
+    parser.add_argument('--config', type=Path, default=CONFIG_PATH, help='GopherCAN config (default lib/go4-24e.yaml)')
+    parser.add_argument('--no-save', action='store_true', help="don't record this run in bench/history.json")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        parameters = gcan.get_params(gcan.load_path(args.config))
+
+    settings = {
+        'config': args.config.name,
+        'size': int(args.size * 1024 * 1024),
+        'n_channels': args.channels,
+        'rates': tuple(float(r) for r in args.rates.split(',')),
+        'escape_density': args.escape_density,
+        'seed': args.seed,
+    }
+
+    # generated files are deterministic, so reuse them between runs
+    DATA_DIR.mkdir(exist_ok=True)
+    rates = '-'.join(f'{r:g}' for r in settings['rates'])
+    gdat_path = DATA_DIR / f"{Path(settings['config']).stem}_{args.size:g}MB_{args.channels}ch_{rates}Hz_esc{args.escape_density:g}_seed{args.seed}.gdat"
+    info_path = gdat_path.with_suffix('.json')
+    if gdat_path.is_file() and info_path.is_file():
+        with open(info_path) as f:
+            info = json.load(f)
+    else:
+        print(f'generating {gdat_path} ... ', end='', flush=True)
+        start = time.time()
+        # generate in a separate process so that it doesn't count towards this process's peak RSS
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            info = pool.submit(generate.generate, gdat_path, parameters, settings['size'], settings['n_channels'], settings['rates'], settings['escape_density'], seed=settings['seed']).result()
+        info['config'] = settings['config']
+        with open(info_path, 'w') as f:
+            json.dump(info, f, indent=2)
+        elapsed = round(time.time() - start, 2)
+        print(f'({elapsed}s)')
+    print(f"{info['size']} bytes, {info['n_packets']} packets, {info['n_channels']} channels, {info['duration_s']}s of data")
+
+    with open(gdat_path, 'rb') as f:
+        (sof, _, data) = f.read().partition(b'.gdat:')
+    t0 = gdat.get_t0(sof)
+    ld_path = gdat_path.with_suffix('.ld')
+
+    best = {}
+    peaks = {}
+    for i in range(args.repeat):
+        print(f'run {i + 1}/{args.repeat}... ', end='', flush=True)
+        (times, run_peaks) = run_stages(data, parameters, t0, ld_path, args.mode)
+        if i == 0:
+            peaks = run_peaks
+        print(f'({round(sum(times.values()), 2)}s)')
+        for (stage, seconds) in times.items():
+            best[stage] = min(best.get(stage, seconds), seconds)
+    os.remove(ld_path)
+
+    mb = info['size'] / (1024 * 1024)
+    peak = peak_rss_mb()
+    # peak RSS never decreases, so each stage records the peak up to the end of that stage in the first run
+    run = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'generator': info,
+        'mode': args.mode,
+        'repeat': args.repeat,
+        'stages': {stage: {'seconds': round(best[stage], 4), 'mb_per_s': round(mb / best[stage], 1), 'peak_rss_mb': peaks[stage]} for stage in STAGES},
+        'total_s': round(sum(best.values()), 4),
+        'total_mb_per_s': round(mb / sum(best.values()), 1),
+        'peak_rss_mb': peak,
+    }
+
+    history = load_history()
+    previous = next((r for r in reversed(history) if run_key(r) == run_key(run)), None)
+    print()
+    print_results(run, previous)
+
+    if not args.no_save:
+        history.append(run)
+        save_history(history)
+        print(f'\nsaved to {HISTORY_PATH}')
+
+if __name__ == '__main__':
+    main()
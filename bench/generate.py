@@ -0,0 +1,99 @@
+import time
+import numpy as np
+
+from lib import gdat
+
+# deterministic synthetic .gdat files for benchmarking
+# channels are sampled at fixed rates with a little timestamp jitter, values follow a random walk,
+# and a configurable fraction of packets contain bytes that have to be escaped
+
+RATES_HZ = (200, 100, 50, 20, 10, 1) # assigned to channels in turn
+ESCAPE_DENSITY = 0.02 # fraction of packets with a data byte set to START or ESC
+ERROR_RATE = 0.001 # fraction of packets with a corrupted checksum
+T0 = time.struct_time((2024, 5, 1, 12, 30, 0, 2, 122, 0))
+
+# value range used for integer random walks, limited so that channels stay easy to encode
+def value_range(param):
+    if param['type'] == 'FLOATING':
+        return (-1000.0, 1000.0)
+    bits = param['size'] * 8
+    if param['signed']:
+        return (float(max(-(2 ** (bits - 1)), -100000)), float(min(2 ** (bits - 1) - 1, 100000)))
+    return (0.0, float(min(2 ** bits - 1, 100000)))
+
+# random walk of n values within a parameter's value range
+def random_walk(rng, param, n):
+    (lo, hi) = value_range(param)
+    steps = rng.normal(0, (hi - lo) / 1000, n)
+    values = np.clip(rng.uniform(lo, hi) + np.cumsum(steps), lo, hi)
+    if param['type'] != 'FLOATING':
+        values = np.round(values)
+    return values
+
+# build one channel's packets (without start delimiters) as rows of bytes, with their timestamps
+def channel_packets(rng, param, rate_hz, duration_ms, escape_density, error_rate):
+    period = 1000 / rate_hz
+    timestamps = np.arange(rng.uniform(0, period), duration_ms, period)
+    timestamps = np.floor(timestamps + rng.integers(0, 2, len(timestamps))).astype(np.int64)
+
+    dtype = gdat.packet_dtype(param['format'])
+    records = np.zeros(len(timestamps), dtype=dtype)
+    records['timestamp'] = timestamps
+    records['id'] = param['id']
+    records['value'] = random_walk(rng, param, len(timestamps))
+    rows = records.view(np.uint8).reshape(len(records), dtype.itemsize)
+
+    # put START or ESC in the last (least significant) data byte of some packets
+    escaped = rng.random(len(rows)) < escape_density
+    rows[escaped, -2] = rng.choice([gdat.START, gdat.ESC], int(escaped.sum()))
+
+    checksums = (gdat.START + rows[:, :-1].sum(axis=1, dtype=np.int64)) & 0xFF
+    corrupt = rng.random(len(rows)) < error_rate
+    rows[:, -1] = checksums ^ corrupt
+    return (timestamps, rows)
+
+# generate about `size` bytes of .gdat data for the first n_channels parameters (by ID) and write it to path
+# returns a dictionary describing the generated file
+def generate(path, parameters, size, n_channels=50, rates=RATES_HZ, escape_density=ESCAPE_DENSITY, error_rate=ERROR_RATE, seed=0):
+    rng = np.random.default_rng(seed)
+    params = [parameters[id] for id in sorted(parameters)[:n_channels]]
+    channel_rates = [rates[i % len(rates)] for i in range(len(params))]
+
+    # pick a duration that produces roughly the requested size
+    bytes_per_s = sum(rate * (gdat.packet_dtype(p['format']).itemsize + 1) for (p, rate) in zip(params, channel_rates))
+    duration_ms = 1000 * size / (bytes_per_s * (1 + escape_density))
+
+    timestamps = []
+    packets = []
+    for (param, rate) in zip(params, channel_rates):
+        t, rows = channel_packets(rng, param, rate, duration_ms, escape_density, error_rate)
+        timestamps.append(t)
+        packets.extend(rows)
+
+    # interleave every channel's packets in timestamp order
+    timestamps = np.concatenate(timestamps)
+    order = np.argsort(timestamps, kind='stable')
+    lengths = np.array([len(p) for p in packets], dtype=np.int64)
+    flat = np.concatenate(packets) if packets else np.zeros(0, dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    lengths = lengths[order]
+    offsets = np.cumsum(lengths) - lengths
+    data = flat[np.repeat(starts[order] - offsets, lengths) + np.arange(lengths.sum())]
+
+    # escape packets and insert start delimiters
+    out = gdat.frame_packets(data, lengths)
+
+    with open(path, 'wb') as f:
+        f.write(f'/{time.strftime("%Y-%m-%d-%H-%M-%S", T0)}.gdat:\n'.encode())
+        out.tofile(f)
+
+    return {
+        'size': len(out),
+        'n_packets': len(offsets),
+        'n_channels': len(params),
+        'duration_s': round(duration_ms / 1000, 3),
+        'rates_hz': sorted(set(channel_rates)),
+        'escape_density': escape_density,
+        'error_rate': error_rate,
+        'seed': seed,
+    }
@@ -6,6 +6,8 @@ from rich import box
 import time
 import numpy as np
 
+from lib import batch
+from lib import expr
 from lib import gcan
 from lib import gdat
 from lib import ld
@@ -20,13 +22,16 @@ class Shell(cmd.Cmd):
     config_params = {}
 
     gdat_path: Path = None
-    gdat_t0: time.struct_time = None
-    gdat_channels = {}
+    gdat_file: gdat.GdatFile = None
 
     ld_path: Path = None
+    ld_file: ld.LdFile = None
     ld_metadata = {}
     ld_channels = {}
 
+    math_path: Path = None
+    math_channels = {}
+
     # CONSOLE COMMANDS =========================================================
 
     def do_load(self, arg):
@@ -67,8 +72,21 @@ class Shell(cmd.Cmd):
 
         convert [GOPHERCAN CONFIG NAME] [PATH TO FOLDER]
         e.g. "convert go4-23c.yaml data/"
+
+        optionally choose how channels are resampled: hold (default), linear, or nearest
+        e.g. "convert go4-23c.yaml statefair.gdat linear"
+
+        math channels loaded with "math" are written as extra channels
         '''
-        config_name, gdat_path = arg.split()
+        args = arg.split()
+        if len(args) not in (2, 3):
+            console.print('ERROR: invalid syntax, try "help convert"', style='red')
+            return
+        config_name, gdat_path = args[:2]
+        mode = args[2] if len(args) == 3 else gdat.RESAMPLE_MODE
+        if mode not in gdat.RESAMPLE_MODES:
+            console.print(f'ERROR: unknown resample mode "{mode}", try "help convert"', style='red')
+            return
 
         try:
             self.load_config(config_name)
@@ -80,23 +98,45 @@ class Shell(cmd.Cmd):
         if gdat_path.is_file():
             # convert single file
             try:
-                self.load_gdat(gdat_path)
+                self.load_gdat(gdat_path, mode)
                 self.convert()
             except Exception as err:
                 console.print(err, style='red')
         elif gdat_path.is_dir():
-            # convert all files in directory
-            for path in gdat_path.iterdir():
-                if path.suffix == '.gdat':
-                    try:
-                        self.load_gdat(path)
-                        self.convert()
-                        print()
-                    except Exception as err:
-                        console.print(err, style='red')
+            # convert all files in directory, several at a time
+            paths = sorted(path for path in gdat_path.iterdir() if path.suffix == '.gdat')
+            if any(self.is_ld_loaded(path.with_suffix('.ld')) for path in paths):
+                self.close_ld()
+            batch.convert(paths, self.config_params, self.print_conversion, mode=mode, math_channels=self.math_channels)
         else:
             console.print(f'ERROR: {gdat_path} does not exist', style='red')
 
+    def do_math(self, arg):
+        '''load math channels (saved by the GUI) to add to converted .ld files
+
+        math [PATH TO math_channels.csv]
+        e.g. "math math_channels.csv"
+
+        math clear
+        '''
+        if arg == 'clear':
+            self.math_path, self.math_channels = (None, {})
+            print('cleared math channels')
+            return
+        path = Path(arg)
+        if not path.is_file():
+            console.print(f'ERROR: {path} does not exist', style='red')
+            return
+        try:
+            self.math_channels = expr.load_csv(path)
+        except Exception as err:
+            console.print(f'ERROR: failed to load math channels from "{path}": {err}', style='red')
+            return
+        self.math_path = path
+        for (name, definition) in self.math_channels.items():
+            print(f"{name} ({definition['unit']})")
+        print(f'loaded {len(self.math_channels)} math channels')
+
     def do_info(self, arg):
         '''display info on loaded data
 
@@ -120,14 +160,24 @@ class Shell(cmd.Cmd):
             if self.gdat_path is None: return
 
             print(f'path: {self.gdat_path}')
-            print(f't0: {time.asctime(self.gdat_t0)}')
+            print(f't0: {time.asctime(self.gdat_file.t0)}')
+            print(f'{self.gdat_file.n_packets} packets')
 
+            # channels that haven't been plotted/queried/converted yet only show indexed packet counts
             table = Table(box=box.MINIMAL)
             keys = ['id', 'name', 'unit', 'type', 'n_points', 't_min', 't_max', 'v_min', 'v_max', 'frequency_hz', 'sample_count', 'shift', 'scalar', 'divisor', 'offset']
             for k in keys:
                 table.add_column(k)
-            for ch in self.gdat_channels.values():
-                table.add_row(*[str(ch[k]) for k in keys])
+            for (id, p) in self.config_params.items():
+                if self.gdat_file.packet_count(id) == 0:
+                    continue
+                if id in self.gdat_file.processed:
+                    ch = self.gdat_file.processed[id]
+                    if ch is not None:
+                        table.add_row(*[str(ch[k]) for k in keys])
+                else:
+                    row = [str(id), p['name'], p['unit'], p['type'], f'~{self.gdat_file.packet_count(id)}']
+                    table.add_row(*row, *['-'] * (len(keys) - len(row)))
             console.print(table)
 
         elif arg == 'ld':
@@ -196,8 +246,9 @@ class Shell(cmd.Cmd):
 
         if args[0] == 'gdat':
             id = int(args[1])
-            if id in self.gdat_channels:
-                gdat.plot(self.gdat_channels[id])
+            ch = self.gdat_file.channel(id) if self.gdat_file is not None else None
+            if ch is not None:
+                gdat.plot(ch)
             else:
                 console.print(f'ERROR: {id} is not a {args[0]} channel', style='red')
 
@@ -220,8 +271,8 @@ class Shell(cmd.Cmd):
         args = arg.split()
         id = int(args[0])
         t = float(args[1]) * 1000
-        if id in self.gdat_channels:
-            ch = self.gdat_channels[id]
+        ch = self.gdat_file.channel(id) if self.gdat_file is not None else None
+        if ch is not None:
             i = np.searchsorted(ch['points'][:,0], t)
 
             print(f"{ch['name']} ({ch['unit']})")
@@ -254,22 +305,23 @@ class Shell(cmd.Cmd):
         if len(self.config_params) == 0:
             raise Exception('ERROR: no parameters loaded')
 
-    def load_gdat(self, path: Path):
+    def load_gdat(self, path: Path, mode: str = gdat.RESAMPLE_MODE):
         if path.suffix != '.gdat':
             raise Exception('ERROR: please provide a path to a .gdat file')
         
-        if path == self.gdat_path:
+        if path == self.gdat_path and mode == self.gdat_file.mode:
             print(f'{path} has already been loaded')
             return
 
         start = time.time()
         print(f'loading {path} ...')
 
-        (sof, ext, data) = path.read_bytes().partition(b'.gdat:')
-        print(f'read {len(data)} bytes of data')
-        self.gdat_t0 = gdat.get_t0(sof)
-        self.gdat_channels = gdat.parse(data, self.config_params)
+        self.gdat_file = gdat.GdatFile(path, self.config_params, mode=mode)
         self.gdat_path = path
+        if self.gdat_file.cached:
+            print(f'loaded cached points ({self.gdat_file.n_packets} packets)')
+        else:
+            print(f'indexed {self.gdat_file.n_packets} packets')
 
         elapsed = round(time.time() - start, 2)
         print(f'loaded in ({elapsed}s)')
@@ -282,25 +334,47 @@ class Shell(cmd.Cmd):
             print(f'{path} has already been loaded')
             return
         
+        self.close_ld()
         start = time.time()
         print(f'loading {path} ...')
 
-        self.ld_metadata, self.ld_channels = ld.parse(path)
+        # only metadata is read here, channel data is loaded when plotted
+        self.ld_file = ld.LdFile(path)
+        self.ld_metadata, self.ld_channels = (self.ld_file.metadata, self.ld_file.channels)
         self.ld_path = path
 
         elapsed = round(time.time() - start, 2)
         print(f'finished in ({elapsed}s)')
 
-    def convert(self):
-        if len(self.gdat_channels) == 0:
-            raise Exception('ERROR: no channels to convert')
+    # close the loaded .ld file, it can't be deleted or overwritten while open (on Windows)
+    def close_ld(self):
+        if self.ld_file is not None:
+            self.ld_file.close()
+        self.ld_file = None
+        self.ld_path = None
+        self.ld_metadata, self.ld_channels = ({}, {})
+
+    def is_ld_loaded(self, path: Path) -> bool:
+        return self.ld_path is not None and path.resolve() == self.ld_path.resolve()
+
+    # progress callback for batch conversions
+    def print_conversion(self, result):
+        print(f"[{result['n_done']}/{result['n_total']}] {result['path']}")
+        if result['error'] is None:
+            print(f"wrote {result['ld_path']}")
+        else:
+            console.print(result['log'], end='', style='red')
+            console.print(result['error'], style='red')
 
+    def convert(self):
         # output .ld next to the .gdat with the same name
         ld_path = self.gdat_path.with_suffix('.ld')
+        if self.is_ld_loaded(ld_path):
+            self.close_ld()
         if ld_path.is_file():
             print(f'deleting {ld_path}')
             ld_path.unlink()
-        ld.write(ld_path, self.gdat_channels, self.gdat_t0)
+        self.gdat_file.write_ld(ld_path, self.math_channels)
 
 if __name__ == '__main__':
     Shell().cmdloop()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import os
+import io
+import time
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from lib import gdat
+from lib import ld
+
+# converts many .gdat files to .ld at once, one file per worker process
+# scripts that use convert() must only start their UI/console under `if __name__ == '__main__':`,
+# since worker processes re-import the main script on platforms that spawn them (Windows, macOS)
+
+# convert a single .gdat file to a .ld next to it with the same name
+# output is captured instead of printed so that concurrent workers don't interleave their logs
+# workers > 1 decodes the file itself in parallel (see gdat.read)
+# math_channels are written as extra channels (see gdat.create_math_channels)
+# returns (ld_path, error, log), ld_path is None and error is the exception message if conversion failed
+def convert_file(path, parameters, mode=gdat.RESAMPLE_MODE, workers=1, math_channels={}):
+    path = Path(path)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            t0, channels = gdat.load(path, parameters, mode=mode, workers=workers, math_channels=math_channels)
+            if len(channels) == 0:
+                raise Exception('ERROR: no channels to convert')
+            ld_path = path.with_suffix('.ld')
+            if ld_path.is_file():
+                print(f'overwriting: {ld_path}')
+                ld_path.unlink()
+            ld.write(ld_path, channels, t0)
+        except Exception as err:
+            return (None, str(err), log.getvalue())
+    return (ld_path, None, log.getvalue())
+
+# convert .gdat files to .ld in parallel
+# callback(result) is called in the calling process as each file finishes, with a result dictionary:
+#   path: .gdat path
+#   ld_path: .ld path, or None if conversion failed
+#   error: exception message, or None if conversion succeeded
+#   log: output from the conversion
+#   n_done, n_total: number of files finished so far and in total
+# math_channels is a dictionary of name -> {'equation': [...], 'unit': str} (see expr.load_csv)
+# returns a list of results in the order the files finished
+def convert(paths, parameters, callback=None, workers=None, mode=gdat.RESAMPLE_MODE, math_channels={}):
+    paths = [Path(p) for p in paths]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # a single file gets all of the workers for decoding instead
+    file_workers = workers if len(paths) == 1 else 1
+    workers = max(1, min(workers, len(paths)))
+
+    results = []
+    def finish(path, ld_path, error, log):
+        result = {
+            'path': path,
+            'ld_path': ld_path,
+            'error': error,
+            'log': log,
+            'n_done': len(results) + 1,
+            'n_total': len(paths),
+        }
+        results.append(result)
+        if callback is not None:
+            callback(result)
+
+    start = time.time()
+    if workers == 1:
+        # skip starting a worker process when there's nothing to run alongside
+        for path in paths:
+            finish(path, *convert_file(path, parameters, mode, file_workers, math_channels))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert_file, path, parameters, mode, 1, math_channels): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # the worker itself failed (e.g. it was killed)
+                    result = (None, f'ERROR: {err}', '')
+                finish(futures[future], *result)
+    elapsed = round(time.time() - start, 2)
+    n_failed = sum(1 for r in results if r['error'] is not None)
+    print(f'converted {len(results) - n_failed}/{len(paths)} files with {workers} workers ({elapsed}s)')
+    return results
@@ -0,0 +1,117 @@
+import os
+import time
+import hashlib
+import zipfile
+from pathlib import Path
+import numpy as np
+
+from lib import gcan
+
+# decoded .gdat points are cached on disk so that reloading a file doesn't decode it again
+# each entry is an uncompressed .npz named "<path hash>-<config hash>-<content hash>.npz" holding one array per channel
+
+CACHE_DIR = Path.home() / '.gophervision' / 'cache'
+CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024 # bytes, least recently used entries are evicted above this
+
+# number and size of blocks sampled from a file when hashing its contents
+HASH_BLOCKS = 16
+HASH_BLOCK_SIZE = 64 * 1024
+
+# hash a .gdat file's size, modification time, and a sample of its contents
+# hashing evenly spaced blocks instead of the whole file keeps lookups fast on large files
+def hash_file(path):
+    stat = os.stat(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(path, 'rb') as f:
+        step = max(stat.st_size // HASH_BLOCKS, HASH_BLOCK_SIZE)
+        for offset in range(0, stat.st_size, step):
+            f.seek(offset)
+            h.update(f.read(HASH_BLOCK_SIZE))
+        # always include the end of the file, which changes if a recording is appended to
+        f.seek(max(stat.st_size - HASH_BLOCK_SIZE, 0))
+        h.update(f.read(HASH_BLOCK_SIZE))
+    return h.hexdigest()
+
+# entries for the same source file and config share a prefix, so older versions can be found and removed
+def entry_prefix(path, parameters):
+    path_hash = hashlib.blake2b(str(Path(path).resolve()).encode(), digest_size=8).hexdigest()
+    return f'{path_hash}-{gcan.hash_params(parameters)}'
+
+def entry_path(path, parameters):
+    return CACHE_DIR / f'{entry_prefix(path, parameters)}-{hash_file(path)}.npz'
+
+# load cached points for a .gdat file
+# returns (t0, points, n_packets, n_errors), where points is a dictionary of ID -> [(timestamp, value), ...]
+# or None if the file hasn't been cached with these parameters
+def load(path, parameters):
+    entry = entry_path(path, parameters)
+    try:
+        with np.load(entry) as npz:
+            t0 = time.struct_time(npz['t0'])
+            points = {int(k): npz[k] for k in npz.files if k.isdigit()}
+            n_packets = int(npz['n_packets'])
+            n_errors = int(npz['n_errors'])
+    except Exception:
+        return None
+    # mark as recently used
+    os.utime(entry)
+    return (t0, points, n_packets, n_errors)
+
+# cache points decoded from a .gdat file, replacing any stale entries for the same file
+# points is a dictionary of ID -> points, or an iterable of (ID, points) pairs that is written one channel at a time
+# so that the whole file's points don't have to be in memory at once
+# n_errors defaults to the packets that didn't decode to a point
+def store(path, parameters, t0, points, n_packets, n_errors=None):
+    entry = entry_path(path, parameters)
+    # write to a temporary file first so a partially written entry is never loaded
+    tmp = entry.with_suffix('.tmp')
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for stale in CACHE_DIR.glob(f'{entry_prefix(path, parameters)}-*.npz'):
+            stale.unlink(missing_ok=True)
+        if isinstance(points, dict):
+            points = points.items()
+        n_points = 0
+        # the same layout as np.savez, which np.load reads
+        with zipfile.ZipFile(tmp, 'w', allowZip64=True) as npz:
+            for (id, p) in points:
+                save_array(npz, str(id), p)
+                n_points += len(p)
+            if n_errors is None:
+                n_errors = n_packets - n_points
+            save_array(npz, 't0', tuple(t0))
+            save_array(npz, 'n_packets', n_packets)
+            save_array(npz, 'n_errors', n_errors)
+        os.replace(tmp, entry)
+        evict()
+    except OSError as err:
+        print(f'WARNING: failed to cache {path}: {err}')
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def save_array(npz, name, value):
+    with npz.open(f'{name}.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asanyarray(value), allow_pickle=False)
+
+# remove least recently used entries until the cache fits in CACHE_MAX_SIZE
+def evict(max_size=CACHE_MAX_SIZE):
+    entries = []
+    for entry in CACHE_DIR.glob('*.npz'):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+    entries.sort()
+    total = sum(size for (_, size, _) in entries)
+    for (_, size, entry) in entries:
+        if total <= max_size:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+# delete every cache entry
+def clear():
+    for entry in CACHE_DIR.glob('*.npz'):
+        entry.unlink(missing_ok=True)
@@ -0,0 +1,91 @@
+import numpy as np
+
+# reduces long series to a few points per pixel for plotting
+# each bucket of samples is replaced by its minimum and maximum (in time order),
+# so spikes and the overall envelope survive no matter how far the view is zoomed out
+
+PYRAMID_BASE = 8 # samples per bucket in the finest level of a Pyramid
+
+# indexes of the minimum and maximum sample in each bucket of `size` consecutive samples
+# the last bucket may be smaller
+def bucket_extremes(y, size):
+    n = len(y) // size * size
+    blocks = y[:n].reshape(-1, size)
+    offsets = np.arange(0, n, size)
+    imin = blocks.argmin(axis=1) + offsets
+    imax = blocks.argmax(axis=1) + offsets
+    if n < len(y):
+        imin = np.append(imin, y[n:].argmin() + n)
+        imax = np.append(imax, y[n:].argmax() + n)
+    return (imin, imax)
+
+# interleave the minimum and maximum index of each bucket, keeping them in time order
+def interleave(imin, imax):
+    return np.sort(np.column_stack((imin, imax)), axis=1).ravel()
+
+# decimate a series to about 2 * n_buckets points
+def minmax(x, y, n_buckets):
+    if len(y) <= 2 * n_buckets:
+        return (x, y)
+    i = interleave(*bucket_extremes(y, -(-len(y) // n_buckets)))
+    return (x[i], y[i])
+
+# multi-resolution min/max index of a series sorted by x
+# level k holds the minimum and maximum sample index of each bucket of PYRAMID_BASE * 2**k samples,
+# which lets any range of the series be decimated in time proportional to the number of points returned
+class Pyramid:
+    def __init__(self, x, y):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.levels = []
+        if len(self.y) <= PYRAMID_BASE:
+            return
+        (imin, imax) = bucket_extremes(self.y, PYRAMID_BASE)
+        imin = imin.astype(np.int64)
+        imax = imax.astype(np.int64)
+        self.levels.append((imin, imax))
+        # each level merges pairs of buckets from the level below
+        while len(imin) > 1:
+            if len(imin) % 2 == 1:
+                imin = np.append(imin, imin[-1])
+                imax = np.append(imax, imax[-1])
+            (a, b) = (imin[0::2], imin[1::2])
+            imin = np.where(self.y[b] < self.y[a], b, a)
+            (a, b) = (imax[0::2], imax[1::2])
+            imax = np.where(self.y[b] > self.y[a], b, a)
+            self.levels.append((imin, imax))
+
+    # returns (x, y) of the samples between x0 and x1 (plus one on either side) decimated to at most about 2 * width points
+    def view(self, x0, x1, width):
+        width = max(int(width), 1)
+        i0 = max(int(np.searchsorted(self.x, x0, side='left')) - 1, 0)
+        i1 = min(int(np.searchsorted(self.x, x1, side='right')) + 1, len(self.x))
+        n = i1 - i0
+        if n <= 2 * width or len(self.levels) == 0:
+            return (self.x[i0:i1], self.y[i0:i1])
+        # coarsest level needed to fit width buckets
+        k = int(np.ceil(np.log2(max(n / width / PYRAMID_BASE, 1))))
+        k = min(k, len(self.levels) - 1)
+        size = PYRAMID_BASE << k
+        (imin, imax) = self.levels[k]
+        (b0, b1) = (i0 // size, (i1 - 1) // size + 1)
+        i = interleave(imin[b0:b1], imax[b0:b1])
+        return (self.x[i], self.y[i])
+
+# plot a series sorted by x on matplotlib axes, decimated to the width of the axes in pixels
+# decimation is recomputed whenever the axes are zoomed or panned
+# returns the plotted line
+def plot(ax, x, y, *args, **kwargs):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    pyramid = Pyramid(x, y)
+    if len(x) == 0:
+        return ax.plot(x, y, *args, **kwargs)[0]
+    (line,) = ax.plot(*pyramid.view(x[0], x[-1], ax.bbox.width), *args, **kwargs)
+
+    def update(ax):
+        (x0, x1) = ax.get_xlim()
+        line.set_data(*pyramid.view(x0, x1, ax.bbox.width))
+
+    ax.callbacks.connect('xlim_changed', update)
+    return line
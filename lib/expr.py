@@ -0,0 +1,147 @@
+import ast
+import csv
+import numpy as np
+
+# math channel expressions
+# an equation is a list of infix tokens as built in the GUI and saved to math_channels.csv:
+#   parameters are [id, name], constants are numeric strings ("10", "-2.5"), and operators are + - * / ^ ( )
+#   e.g. ['(', [120, 'Wheel Speed FL'], '+', [121, 'Wheel Speed FR'], ')', '/', '2']
+# equations are compiled once into nested functions that evaluate either single values or whole NumPy arrays
+
+PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 3}
+
+def divide(a, b):
+    # division by zero evaluates to 0
+    if np.ndim(a) == 0 and np.ndim(b) == 0:
+        return a / b if b != 0 else 0.0
+    b = np.asarray(b, dtype=np.float64)
+    zero = b == 0
+    return np.where(zero, 0.0, np.divide(a, np.where(zero, 1.0, b)))
+
+OPERATORS = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': divide,
+    '^': lambda a, b: np.power(a, b),
+}
+
+def is_number(token):
+    try:
+        float(token)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+# a compiled equation
+# expression(values) evaluates it, where values maps each input parameter ID to a value or an array of values
+# arrays must all be the same length and the result is an array of that length
+class Expression:
+    def __init__(self, equation: list):
+        self.equation = equation
+        self.inputs = {token[0] for token in equation if isinstance(token, list)}
+        self.evaluate = compile(equation)
+
+    def __call__(self, values: dict):
+        result = self.evaluate(values)
+        # terms that don't depend on an input (e.g. "0 * x") are single values
+        shape = np.broadcast_shapes(*(np.shape(values[id]) for id in self.inputs))
+        if np.shape(result) != shape:
+            result = np.broadcast_to(result, shape).copy()
+        return result
+
+# build a function from an equation's tokens using the shunting-yard algorithm
+# operators are left associative, matching how equations were evaluated in the GUI
+def compile(equation: list):
+    operands = [] # stack of functions
+    ops = [] # stack of operators
+
+    def reduce():
+        op = ops.pop()
+        if len(operands) < 2:
+            raise Exception(f'ERROR: missing operand for "{op}" in {equation}')
+        (b, a) = (operands.pop(), operands.pop())
+        fn = OPERATORS[op]
+        operands.append(lambda values: fn(a(values), b(values)))
+
+    expect_operand = True
+    negate = False
+    for token in equation:
+        if expect_operand and token == '-':
+            # unary minus
+            negate = not negate
+            continue
+        if isinstance(token, list):
+            id = token[0]
+            operand = lambda values, id=id: values[id]
+        elif is_number(token):
+            value = float(token)
+            operand = lambda values, value=value: value
+        elif token == '(':
+            if not expect_operand:
+                raise Exception(f'ERROR: unexpected "(" in {equation}')
+            ops.append('-(' if negate else '(')
+            negate = False
+            continue
+        elif token == ')':
+            while ops and ops[-1] not in ('(', '-('):
+                reduce()
+            if not ops:
+                raise Exception(f'ERROR: unmatched ")" in {equation}')
+            if ops.pop() == '-(':
+                inner = operands.pop()
+                operands.append(lambda values: -inner(values))
+            expect_operand = False
+            continue
+        elif token in OPERATORS:
+            if expect_operand:
+                raise Exception(f'ERROR: unexpected "{token}" in {equation}')
+            while ops and ops[-1] in OPERATORS and PRECEDENCE[ops[-1]] >= PRECEDENCE[token]:
+                reduce()
+            ops.append(token)
+            expect_operand = True
+            continue
+        else:
+            raise Exception(f'ERROR: invalid token "{token}" in {equation}')
+
+        if not expect_operand:
+            raise Exception(f'ERROR: missing operator before "{token}" in {equation}')
+        if negate:
+            operand = lambda values, operand=operand: -operand(values)
+            negate = False
+        operands.append(operand)
+        expect_operand = False
+
+    if expect_operand:
+        raise Exception(f'ERROR: incomplete equation {equation}')
+    while ops:
+        if ops[-1] in ('(', '-('):
+            raise Exception(f'ERROR: unmatched "(" in {equation}')
+        reduce()
+    return operands[0]
+
+# map each parameter ID to the names of the expressions that use it
+# expressions is a dictionary of name -> Expression
+def dependents(expressions: dict):
+    deps = {}
+    for (name, expression) in expressions.items():
+        for id in expression.inputs:
+            deps.setdefault(id, []).append(name)
+    return deps
+
+# load math channels saved by the GUI to math_channels.csv (name, equation, unit, after a header row)
+# returns a dictionary of name -> {'equation': [...], 'unit': str}, skipping equations that fail to compile
+def load_csv(path):
+    math_channels = {}
+    with open(path, mode='r', newline='', encoding='utf-8') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+        for row in reader:
+            equation = ast.literal_eval(row[1])
+            try:
+                Expression(equation)
+            except Exception as err:
+                print(f'{err}, skipping math channel "{row[0]}"')
+                continue
+            math_channels[row[0]] = {'equation': equation, 'unit': row[2]}
+    return math_channels
@@ -1,3 +1,4 @@
+import hashlib
 from pathlib import Path
 import yaml
 import urllib.request
@@ -55,3 +56,9 @@ def load_url(url: str):
         config = yaml.safe_load(f)
     print(f'loaded GopherCAN config: {url}')
     return config
+
+# hash the parts of a parameter dictionary that affect how .gdat packets are decoded
+# names and units can change without invalidating decoded data
+def hash_params(parameters: dict):
+    key = repr(sorted((id, p['type']) for (id, p) in parameters.items()))
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
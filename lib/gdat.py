@@ -1,9 +1,18 @@
+import os
 import time
+import zlib
+from pathlib import Path
 import struct
 import numpy as np
 import math
 from fractions import Fraction
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+from lib import cache
+from lib import decimate
+from lib import expr
+from lib import ld
 
 # .gdat files begin with "/PLM_YYYY-MM-DD-HH-MM-SS.gdat:" (RTC time of file creation)
 # followed by a series of packets of the following format (big endian):
@@ -18,6 +27,22 @@ START = 0x7E
 ESC = 0x7D
 ESC_XOR = 0x20
 
+CHUNK_SIZE = 16 * 1024 * 1024 # bytes to read from a .gdat file at a time
+DECODE_BLOCK_SIZE = 1024 * 1024 # bytes to decode at once, small enough for the intermediate arrays to stay in CPU cache
+
+ENCODE_CHUNK_SIZE = 1024 * 1024 # samples to resample and encode at a time when streaming to .ld
+INDEX_CHECK_SIZE = 4096 # bytes at each end of a saved index's coverage that must match to reuse it
+
+INT32_MIN = -2**31
+INT32_MAX = 2**31 - 1
+
+# how channels are fit to an evenly spaced time axis, see resample()
+RESAMPLE_MODES = ('hold', 'linear', 'nearest')
+RESAMPLE_MODE = 'hold'
+
+# unescaped size of a packet with the largest (8 byte) data type, excluding the start delimiter
+PACKET_MAX_SIZE = 15
+
 def get_t0(sof):
     try:
         return time.strptime(sof.decode(), '/PLM_%Y-%m-%d-%H-%M-%S')
@@ -28,78 +53,420 @@ def get_t0(sof):
             print(f'WARNING: failed to parse timestamp "{sof.decode()}"')
             return time.gmtime(0)
 
+# numpy record layout of an unescaped packet, value_format is a GopherCAN type's struct format (e.g. ">H")
+# excludes the start delimiter, which is consumed when splitting packets
+def packet_dtype(value_format):
+    return np.dtype([
+        ('timestamp', '>u4'),
+        ('id', '>u2'),
+        ('value', value_format),
+        ('checksum', 'u1'),
+    ])
+
+# view a byte array as records of the given dtype beginning at every byte offset
+# indexing the view with packet start indexes gathers those packets as records
+def records_at(buf, dtype, offset=0):
+    return np.ndarray((len(buf) - offset - dtype.itemsize + 1,), dtype, buf, offset, (1,))
+
+# unescape packets in place: packets[first[i]:first[i] + lengths[i]] becomes the unescaped bytes of packet i
+# only needs to visit packets that actually contain escape bytes, since unescaping never lengthens a packet
+def unescape(packets, first, raw_lengths, escaped):
+    first = first[escaped]
+    raw_lengths = raw_lengths[escaped]
+    # gather every byte of the escaped packets into one array
+    offsets = np.cumsum(raw_lengths) - raw_lengths
+    pos = np.repeat(first - offsets, raw_lengths) + np.arange(raw_lengths.sum())
+    raw = packets[pos]
+    is_esc = raw == ESC
+    # XOR any byte following an escape byte in the same packet
+    follows_esc = np.zeros(len(raw), dtype=bool)
+    follows_esc[1:] = is_esc[:-1]
+    follows_esc[offsets] = False
+    raw[follows_esc] ^= ESC_XOR
+    # drop escape bytes, shifting the remaining bytes towards the start of their packet
+    kept = np.cumsum(~is_esc)
+    kept_before = np.repeat(kept[offsets] - ~is_esc[offsets], raw_lengths)
+    packets[(np.repeat(first, raw_lengths) + kept - 1 - kept_before)[~is_esc]] = raw[~is_esc]
+
+# split a byte array into packets and unescape them
+# returns a padded copy of the data where packets[first[i]:first[i] + lengths[i]] is the unescaped packet i,
+# and the raw (escaped) length of each packet
+# packets are counted the same way as bytes.split(START), including any bytes before the first start delimiter
+def split_packets(buf):
+    start_pos = np.flatnonzero(buf == START)
+    esc_pos = np.flatnonzero(buf == ESC)
+
+    # packet i begins after start delimiter i-1 (or at the beginning of the data)
+    first = np.concatenate(([0], start_pos + 1))
+    raw_lengths = np.diff(start_pos, prepend=-1, append=len(buf)) - 1
+    n_esc = np.bincount(np.searchsorted(start_pos, esc_pos), minlength=len(first))
+    lengths = raw_lengths - n_esc
+
+    # copy the data with padding so a full-size packet can be viewed from any start index
+    packets = np.zeros(len(buf) + PACKET_MAX_SIZE, dtype=np.uint8)
+    packets[:len(buf)] = buf
+    unescape(packets, first, raw_lengths, n_esc > 0)
+    return (packets, first, raw_lengths, lengths)
+
+# lookup tables for decoding a set of parameters' packets, indexed by ID
+# sizes[id] is the parameter's data size (0 if unknown) and dtypes[layouts[id]] is its packet record layout
+# ranks[id] orders IDs by layout and then by ID, sorting packets by rank groups them by layout and within that by ID
+def packet_tables(parameters):
+    sizes = np.zeros(0x10000, dtype=np.int64)
+    layouts = np.zeros(0x10000, dtype=np.int64)
+    ranks = np.zeros(0x10000, dtype=np.uint16)
+    formats = {}
+    for (id, param) in parameters.items():
+        if 0 <= id < len(sizes):
+            sizes[id] = param['size']
+            layouts[id] = formats.setdefault(param['format'], len(formats))
+    known = sorted((id for id in parameters if 0 <= id < len(sizes)), key=lambda id: (layouts[id], id))
+    ranks[known] = np.arange(len(known))
+    dtypes = [packet_dtype(format) for format in formats]
+    return (sizes, layouts, ranks, dtypes)
+
+# find packets whose length matches their parameter's data size
+# returns the indexes of those packets and their IDs
+def match_packets(packets, first, lengths, sizes):
+    # packets are padded, so an id can be read from every packet without checking its length first
+    # a packet too short to hold an id reads garbage, but then its length can't match a data size
+    ids = records_at(packets, np.dtype('>u2'), 4)[first]
+    expected = sizes[ids]
+    # a packet holds a timestamp, id, data, and checksum
+    matched = np.flatnonzero((expected > 0) & (lengths == expected + 7))
+    return (matched, ids[matched])
+
+# decode every packet in a byte string (or uint8 array) at once
+# returns (timestamps, ids, values) of valid packets grouped by ID (in file order within each ID),
+# the number of packets found, and the number of packets that failed to decode
+# tables from packet_tables(parameters) can be passed in when decoding many small blocks with the same parameters
+def decode_packets(data, parameters, tables=None):
+    sizes, layouts, ranks, dtypes = packet_tables(parameters) if tables is None else tables
+    packets, first, raw_lengths, lengths = split_packets(np.frombuffer(data, dtype=np.uint8))
+    n_packets = len(first)
+    matched, ids = match_packets(packets, first, lengths, sizes)
+    starts = first[matched]
+
+    # group packets by layout and id, ranks fit in 16 bits which lets numpy use a (stable) radix sort
+    order = np.argsort(ranks[ids], kind='stable')
+    ids = ids[order].astype(np.int64)
+    starts = starts[order]
+    # packets sharing a record layout are now contiguous
+    bounds = np.searchsorted(layouts[ids], np.arange(len(dtypes) + 1))
+
+    # unpack packets sharing a record layout together and validate checksums
+    valid = np.zeros(len(ids), dtype=bool)
+    timestamps = np.empty(len(ids), dtype=np.float64)
+    values = np.empty(len(ids), dtype=np.float64)
+    views = {}
+    for (layout, dtype) in enumerate(dtypes):
+        (lo, hi) = (bounds[layout], bounds[layout + 1])
+        if lo == hi:
+            continue
+        if dtype.itemsize not in views:
+            # gathering opaque (void) records is much faster than gathering structured ones
+            views[dtype.itemsize] = records_at(packets, np.dtype((np.void, dtype.itemsize)))
+        records = views[dtype.itemsize][starts[lo:hi]].view(dtype)
+        # sum of bytes (ignoring overflow) including the start delimiter
+        block = records.view(np.uint8).reshape(len(records), -1)
+        checksums = np.full(len(records), START, dtype=np.uint8)
+        for i in range(block.shape[1] - 1):
+            checksums += block[:, i]
+        valid[lo:hi] = checksums == records['checksum']
+        timestamps[lo:hi] = records['timestamp']
+        values[lo:hi] = records['value']
+
+    n_valid = int(valid.sum())
+    return (timestamps[valid], ids[valid], values[valid], n_packets, n_packets - n_valid)
+
+# escape unescaped packets and put a start delimiter before each one
+# data holds consecutive packets (excluding start delimiters), lengths[i] is the length of packet i
+# returns the framed packets as a byte array
+def frame_packets(data, lengths):
+    special = (data == START) | (data == ESC)
+    n_special = np.concatenate(([0], np.cumsum(special)))
+    offsets = np.cumsum(lengths) - lengths
+    # every byte moves right by the escape bytes up to it and the start delimiters up to its packet
+    pos = np.arange(len(data)) + n_special[1:] + np.repeat(np.arange(1, len(lengths) + 1), lengths)
+    out = np.empty(len(data) + n_special[-1] + len(lengths), dtype=np.uint8)
+    out[pos] = np.where(special, data ^ ESC_XOR, data)
+    out[pos[special] - 1] = ESC
+    out[offsets + n_special[offsets] + np.arange(len(offsets))] = START
+    return out
+
+# encode packets in the given order, the inverse of decode_packets
+# every ID must be in the parameters that tables were built from (see packet_tables)
+# returns the framed packets as a byte array
+def encode_packets(timestamps, ids, values, tables):
+    sizes, layouts, _, dtypes = tables
+    ids = np.asarray(ids, dtype=np.int64)
+    packet_layouts = layouts[ids]
+    lengths = sizes[ids] + 7
+    offsets = np.cumsum(lengths) - lengths
+    data = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for (layout, dtype) in enumerate(dtypes):
+        selected = np.flatnonzero(packet_layouts == layout)
+        if len(selected) == 0:
+            continue
+        records = np.empty(len(selected), dtype=dtype)
+        records['timestamp'] = timestamps[selected]
+        records['id'] = ids[selected]
+        records['value'] = values[selected]
+        block = records.view(np.uint8).reshape(len(records), -1)
+        # sum of bytes (ignoring overflow) including the start delimiter
+        records['checksum'] = (START + block[:, :-1].sum(axis=1, dtype=np.int64)) & 0xFF
+        data[offsets[selected, None] + np.arange(dtype.itemsize)] = block
+    return frame_packets(data, lengths)
+
+# decode packets from a byte string and group them by parameter ID
+# returns a dictionary of ID -> [(timestamp, value), ...] in file order,
+# the number of packets found, and the number of packets that failed to decode
+# the data is decoded in blocks of about DECODE_BLOCK_SIZE bytes (see block_ranges)
+def decode(data, parameters):
+    tables = packet_tables(parameters)
+    view = memoryview(data)
+    results = [decode_block(view[lo:hi], parameters, tables) for (lo, hi) in block_ranges(data)]
+    return results[0] if len(results) == 1 else merge(results)
+
+# split data into blocks of about DECODE_BLOCK_SIZE bytes that can be decoded separately (see split_ranges)
+def block_ranges(data):
+    return split_ranges(data, 0, len(data), max(-(-len(data) // DECODE_BLOCK_SIZE), 1))
+
+# decode a single block of packets, see decode
+def decode_block(data, parameters, tables=None):
+    timestamps, ids, values, n_packets, n_errors = decode_packets(data, parameters, tables)
+    # each ID's points are a slice of one array, splitting per ID costs more than decoding a small block
+    bounds = (np.flatnonzero(np.diff(ids)) + 1).tolist()
+    block = np.column_stack((timestamps, values))
+    points = {int(ids[lo]): block[lo:hi] for (lo, hi) in zip([0, *bounds], [*bounds, len(ids)]) if lo < hi}
+    return (points, n_packets, n_errors)
+
+# growable NumPy array, over-allocates so that repeated appends stay cheap
+class Buffer:
+    def __init__(self, shape=(), dtype=np.float64, capacity=1024):
+        self.data = np.empty((capacity, *shape), dtype=dtype)
+        self.size = 0
+
+    def append(self, values):
+        size = self.size + len(values)
+        if size > len(self.data):
+            data = np.empty((max(size, len(self.data) * 3 // 2), *self.data.shape[1:]), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        self.data[self.size:size] = values
+        self.size = size
+
+    # view the appended values without trimming, for a buffer that's still being appended to
+    def view(self):
+        return self.data[:self.size]
+
+    # trim unused capacity and return the appended values
+    def array(self):
+        if len(self.data) != self.size:
+            self.data = self.data[:self.size].copy()
+        return self.data
+
 # decode packets from a byte string and organize into channels
-def parse(bytes, parameters):
-    channels = {
-        id: {
-            'id': id,
-            'name': param['name'],
-            'unit': param['unit'],
-            'type': param['type'],
-            # raw data
-            'n_points': 0,         # num raw datapoints
-            'points': [],
-            't_min': 0,            # min timestamp
-            't_max': 0,            # max timestamp
-            'v_min': 0,            # min value
-            'v_max': 0,            # max value
-            # interpolated data
-            'delta_ms': 0,
-            'frequency_hz': 0,
-            'sample_count': 0,     # num interpolated datapoints
-            't_int': [],           # evenly spaced timestamps
-            'v_int': [],           # interpolated values
-            # s32 encoded data (on t_int time axis)
-            # encoded_value = value / 10^-shift / scalar * divisor
-            # value = encoded_value * 10^-shift * scalar / divisor
-            'v_enc': [],
-            'shift': 0,
-            'scalar': 0,
-            'divisor': 0,
-            'offset': 0,
-        }
-        for (id, param) in parameters.items()
-    }
+# workers > 1 decodes separate ranges of the data in parallel processes, with the same result
+# math_channels are added as derived channels (see create_math_channels)
+def parse(bytes, parameters, mode=RESAMPLE_MODE, workers=1, math_channels={}):
+    print('decoding packets... ', end='', flush=True)
+    start = time.time()
+    if workers > 1:
+        pieces = [bytes[lo:hi] for (lo, hi) in split_ranges(bytes, 0, len(bytes), workers)]
+        with ProcessPoolExecutor(max_workers=len(pieces)) as pool:
+            results = list(pool.map(decode, pieces, [parameters] * len(pieces)))
+        points, n_packets, n_errors = merge(results)
+    else:
+        points, n_packets, n_errors = decode(bytes, parameters)
+    elapsed = round(time.time() - start, 2)
+    print(f'({elapsed}s)')
+    print(f'{n_packets} packets, {n_errors} errors')
+    return create_channels(points, parameters, mode, math_channels)
+
+# decode a .gdat file and organize into channels
+# decoded points are cached on disk (see lib/cache.py), so reloading an unchanged file skips decoding
+# returns (t0, channels)
+def load(path, parameters, chunk_size=CHUNK_SIZE, use_cache=True, mode=RESAMPLE_MODE, workers=1, math_channels={}):
+    cached = cache.load(path, parameters) if use_cache else None
+    if cached is not None:
+        t0, points, n_packets, n_errors = cached
+        print(f'loaded cached points for {path}')
+        print(f'{n_packets} packets, {n_errors} errors')
+    else:
+        t0, points, n_packets, n_errors = read(path, parameters, chunk_size, workers)
+        if use_cache:
+            cache.store(path, parameters, t0, points, n_packets, n_errors)
+    return (t0, create_channels(points, parameters, mode, math_channels))
+
+# decode a .gdat file in fixed-size chunks
+# avoids holding the raw file in memory, decoded points are collected in growable per-channel buffers
+# workers > 1 decodes separate ranges of the file in parallel processes, with the same result
+# returns (t0, points, n_packets, n_errors), where points is a dictionary of ID -> [(timestamp, value), ...] in file order
+def read(path, parameters, chunk_size=CHUNK_SIZE, workers=1):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        (sof, data_start) = read_header(f, chunk_size)
+    t0 = get_t0(sof)
 
     print('decoding packets... ', end='', flush=True)
     start = time.time()
-    n_errors = 0
-    # split byte string by start delimiter
-    packets = bytes.split(START.to_bytes(1, 'big'))
-    for packet in packets:
-        # unescape packet
-        pkt = bytearray()
-        esc = False
-        for b in packet:
-            if b == ESC:
-                esc = True
-            elif esc:
-                pkt.append(b ^ ESC_XOR)
-                esc = False
-            else:
-                pkt.append(b)
-        # unpack components
-        try:
-            ts, id = struct.unpack('>IH', pkt[0:6])
-            value = struct.unpack(parameters[id]['format'], pkt[6:-1])[0]
-        except:
-            n_errors += 1
-            continue
-        # validate checksum
-        sum = START
-        for b in pkt[:-1]: sum += b
-        if sum.to_bytes(2, 'big')[-1] != pkt[-1]:
-            n_errors += 1
-            continue
-        # at this point, packet is valid, add to channel
-        channels[id]['points'].append((ts, value))
+    if workers > 1:
+        with open(path, 'rb') as f:
+            ranges = split_ranges(f, data_start, size, workers)
+        (starts, ends) = zip(*ranges)
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            results = list(pool.map(
+                read_range,
+                [path] * len(ranges), starts, ends, [parameters] * len(ranges), [chunk_size] * len(ranges)
+            ))
+        points, n_packets, n_errors = merge([result[:3] for result in results])
+        n_bytes = sum(result[3] for result in results)
+    else:
+        points, n_packets, n_errors, n_bytes = read_range(path, data_start, size, parameters, chunk_size)
     elapsed = round(time.time() - start, 2)
     print(f'({elapsed}s)')
-    print(f'{len(packets)} packets, {n_errors} errors')
+    print(f'read {n_bytes} bytes of data')
+    print(f'{n_packets} packets, {n_errors} errors')
+    return (t0, points, n_packets, n_errors)
+
+# read the header of an open .gdat file ("/YYYY-MM-DD-HH-MM-SS.gdat:") chunk_size bytes at a time
+# returns the header before ".gdat:" and the offset of the data after it (the end of the file if there's no header)
+def read_header(f, chunk_size=CHUNK_SIZE):
+    head = bytearray()
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return (bytes(head), len(head))
+        # ".gdat:" may be split between chunks, so the end of the previous chunk is searched again
+        search_from = max(len(head) - len(b'.gdat:') + 1, 0)
+        head += chunk
+        i = head.find(b'.gdat:', search_from)
+        if i >= 0:
+            return (bytes(head[:i]), i + len(b'.gdat:'))
+
+# decode the bytes of a .gdat file between start and end (exclusive) in fixed-size chunks
+# returns (points, n_packets, n_errors, n_bytes)
+def read_range(path, start, end, parameters, chunk_size=CHUNK_SIZE):
+    tables = packet_tables(parameters)
+    buffers = {}
+    n_bytes = 0
+    n_packets = 0
+    n_errors = 0
+    tail = b''
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while True:
+            chunk = f.read(min(chunk_size, remaining))
+            remaining -= len(chunk)
+            data = tail + chunk
+            if chunk:
+                # only decode up to the last start delimiter, the final packet may continue in the next chunk
+                # the delimiter itself is dropped, matching how bytes.split(START) counts packets
+                i = data.rfind(START)
+                if i < 0:
+                    tail = data
+                    continue
+                (data, tail) = (data[:i], data[i+1:])
+            n_bytes += len(data)
+            view = memoryview(data)
+            for (lo, hi) in block_ranges(data):
+                points, n, e = decode_block(view[lo:hi], parameters, tables)
+                n_packets += n
+                n_errors += e
+                for (id, pts) in points.items():
+                    buffers.setdefault(id, Buffer((2,))).append(pts)
+            if not chunk:
+                break
+    points = {id: buffer.array() for (id, buffer) in buffers.items()}
+    return (points, n_packets, n_errors, n_bytes)
+
+# split data[start:end] into roughly equal ranges that begin right after a start delimiter
+# data is a byte string or an open file, the delimiters between ranges are left out of them
+# since START is always escaped inside packets, any START byte is a packet boundary
+# and decoding each range separately finds the same packets as decoding all of the data at once
+# returns a list of (start, end) pairs
+def split_ranges(data, start, end, n):
+    ranges = []
+    lo = start
+    for k in range(1, n):
+        bound = max(start + (end - start) * k // n, lo)
+        i = find(data, START, bound, end)
+        if i < 0:
+            break
+        ranges.append((lo, i))
+        lo = i + 1
+    ranges.append((lo, end))
+    return ranges
+
+# index of the first byte equal to value in data[start:end], or -1
+def find(data, value, start, end):
+    if isinstance(data, (bytes, bytearray)):
+        return data.find(value, start, end)
+    data.seek(start)
+    pos = start
+    while pos < end:
+        chunk = data.read(min(64 * 1024, end - pos))
+        if not chunk:
+            break
+        i = chunk.find(value)
+        if i >= 0:
+            return pos + i
+        pos += len(chunk)
+    return -1
+
+# combine the results of decoding consecutive ranges of the same data
+# ranges are in file order, so joining each ID's points keeps them in file order
+def merge(results):
+    points = {}
+    for (pts, _, _) in results:
+        for (id, p) in pts.items():
+            points.setdefault(id, []).append(p)
+    points = {id: p[0] if len(p) == 1 else np.concatenate(p) for (id, p) in points.items()}
+    n_packets = sum(n for (_, n, _) in results)
+    n_errors = sum(e for (_, _, e) in results)
+    return (points, n_packets, n_errors)
+
+# create an empty channel for a parameter
+# points is an array of [(timestamp, value), ...] in file order
+def new_channel(id, param, points):
+    return {
+        'id': id,
+        'name': param['name'],
+        'unit': param['unit'],
+        'type': param['type'],
+        # raw data
+        'n_points': len(points), # num raw datapoints
+        'points': points,
+        't_min': 0,            # min timestamp
+        't_max': 0,            # max timestamp
+        'v_min': 0,            # min value
+        'v_max': 0,            # max value
+        # interpolated data
+        'delta_ms': 0,
+        'frequency_hz': 0,
+        'sample_count': 0,     # num interpolated datapoints
+        't_int': [],           # evenly spaced timestamps
+        'v_int': [],           # interpolated values
+        # s32 encoded data (on t_int time axis)
+        # encoded_value = value / 10^-shift / scalar * divisor
+        # value = encoded_value * 10^-shift * scalar / divisor
+        'v_enc': [],
+        'shift': 0,
+        'scalar': 0,
+        'divisor': 0,
+        'offset': 0,
+    }
+
+# organize decoded points into channels, then resample and encode them for .ld
+# points is a dictionary of ID -> [(timestamp, value), ...] in file order
+# math_channels are added after the parameter channels, keyed by name (see create_math_channels)
+def create_channels(points, parameters, mode=RESAMPLE_MODE, math_channels={}):
+    channels = {id: new_channel(id, param, points.get(id, [])) for (id, param) in parameters.items()}
 
     # remove channels with no data
     for id in list(channels.keys()):
-        channels[id]['n_points'] = len(channels[id]['points'])
         if channels[id]['n_points'] == 0:
             print(f"removing empty channel: {channels[id]['name']} ({id})")
             del channels[id]
@@ -107,112 +474,526 @@ def parse(bytes, parameters):
     print('sorting data... ', end='', flush=True)
     start = time.time()
     for ch in channels.values():
-        # sort points by timestamp
-        ch['points'].sort(key=lambda pt: pt[0])
-        ch['points'] = np.array(ch['points'], dtype=np.float64)
-        # timestamps = ch['points'][:,0]
-        # values     = ch['points'][:,1]
-
-        ch['t_min'] = ch['points'][0,0]
-        ch['t_max'] = ch['points'][-1,0]
-        ch['v_min'] = ch['points'][:,1].min()
-        ch['v_max'] = ch['points'][:,1].max()
+        sort_points(ch)
     elapsed = round(time.time() - start, 2)
     print(f'({elapsed}s)')
 
     print('calculating sample rates... ', end='', flush=True)
     start = time.time()
     for ch in channels.values():
-        # single datapoint: use 1Hz by default
-        if ch['n_points'] == 1:
-            ch['delta_ms'] = 1000
-            ch['frequency_hz'] = 1
-        # multiple datapoints: calculate an appropriate frequency
-        else:
-            # get time delta between points
-            deltas = np.diff(ch['points'][:,0])
-            # remove deltas above 100ms (minimum frequency = 10Hz)
-            deltas = deltas[deltas <= 100]
-            # or below 1ms (maximum frequency = 1000Hz)
-            deltas = deltas[deltas >= 1]
-            if len(deltas) == 0:
-                delta = 100
-            else:
-                # find the most common delta
-                unique_deltas, counts = np.unique(deltas, return_counts=True)
-                delta = int(unique_deltas[counts == counts.max()].min())
-            # round so that frequency is an integer
-            while 1000 % delta != 0: delta += 1
-            ch['delta_ms'] = delta
-            ch['frequency_hz'] = math.trunc(1000 / delta)
-        # calculate sample count needed to reach final datapoint at this frequency
-        ch['sample_count'] = math.trunc(ch['t_max'] / ch['delta_ms'])
+        set_sample_rate(ch)
     elapsed = round(time.time() - start, 2)
     print(f'({elapsed}s)')
 
     print('fitting to time axis... ', end='', flush=True)
     start = time.time()
     for ch in channels.values():
-        # create a new time axis with this channel's time delta and sample count
-        t_int = list(range(0, ch['sample_count'] * ch['delta_ms'], ch['delta_ms']))
-
-        # for each tick in the new time axis, use the closest recorded datapoint
-        # "closest" means the last point with a timestamp less than the tick
-        # this produces a curve that sometimes slightly lags the recorded data
-        v_int = []
-        i = 0
-        for t in t_int:
-            # skip forward to a point with timestamp ~t
-            while i+1 < ch['n_points'] and t > ch['points'][i+1][0]:
-                i += 1
-            v_int.append(ch['points'][i][1])
-
-        ch['t_int'] = np.array(t_int, dtype=np.float64)
-        ch['v_int'] = np.array(v_int, dtype=np.float64)
+        fit_time_axis(ch, mode)
     elapsed = round(time.time() - start, 2)
     print(f'({elapsed}s)')
 
     print('encoding... ', end='', flush=True)
     start = time.time()
     for id in list(channels.keys()):
-        ch = channels[id]
-        abs_max = max(abs(ch['v_min']), abs(ch['v_max']))
+        if not encode_channel(channels[id]):
+            del channels[id]
+    elapsed = round(time.time() - start, 2)
+    print(f'({elapsed}s)')
 
-        # find shift, scalar, and divisor to fit value in a s32
-        # encoded_value = value / 10^-shift / scalar * divisor
-        if abs_max == 0:
-            ch['shift'], ch['scalar'], ch['divisor'] = (9, 1, 1)
+    if len(math_channels) > 0:
+        print('computing math channels... ', end='', flush=True)
+        start = time.time()
+        created = create_math_channels(math_channels, channels, mode)
+        elapsed = round(time.time() - start, 2)
+        print(f'({elapsed}s)')
+        channels.update(created)
+
+    print(f'created {len(channels)} channels')
+    return channels
+
+# create derived channels from math channel equations (see expr.py), evaluated over whole channels at once
+# math_channels is a dictionary of name -> {'equation': [...], 'unit': str}, e.g. from expr.load_csv()
+# channels is a dictionary of ID -> resampled channel, the inputs of each equation
+# returns a dictionary of name -> channel, math channels with missing inputs or that can't be encoded are skipped
+def create_math_channels(math_channels, channels, mode=RESAMPLE_MODE):
+    created = {}
+    for (name, definition) in math_channels.items():
+        ch = math_channel(name, definition, channels, mode)
+        if ch is not None:
+            created[name] = ch
+    return created
+
+# evaluate a math channel on the time axis of its fastest input, over the duration of its longest input
+# other inputs are resampled onto that time axis
+def math_channel(name, definition, channels, mode=RESAMPLE_MODE):
+    expression = expr.Expression(definition['equation'])
+    inputs = {id: channels.get(id) for id in expression.inputs}
+    missing = [id for (id, ch) in inputs.items() if ch is None or ch['sample_count'] == 0]
+    if len(inputs) == 0 or len(missing) > 0:
+        print(f'WARNING: skipping math channel "{name}", missing input channels {missing}')
+        return None
+
+    ch = new_channel(name, {'name': name, 'unit': definition['unit'], 'type': 'FLOATING'}, np.empty((0, 2)))
+    ch['delta_ms'] = min(input['delta_ms'] for input in inputs.values())
+    ch['frequency_hz'] = math.trunc(1000 / ch['delta_ms'])
+    ch['t_min'] = min(input['t_min'] for input in inputs.values())
+    ch['t_max'] = max(input['t_max'] for input in inputs.values())
+    ch['sample_count'] = math.trunc(ch['t_max'] / ch['delta_ms'])
+    ch['t_int'] = np.arange(ch['sample_count'], dtype=np.float64) * ch['delta_ms']
+
+    values = {}
+    for (id, input) in inputs.items():
+        if input['delta_ms'] == ch['delta_ms'] and input['sample_count'] == ch['sample_count']:
+            values[id] = input['v_int']
+        else:
+            values[id] = align(input, ch['t_int'], mode)
+    with np.errstate(all='ignore'):
+        ch['v_int'] = np.asarray(expression(values), dtype=np.float64)
+
+    ch['points'] = np.column_stack((ch['t_int'], ch['v_int']))
+    ch['n_points'] = len(ch['points'])
+    finite = ch['v_int'][np.isfinite(ch['v_int'])]
+    if len(finite) > 0:
+        ch['v_min'], ch['v_max'] = (finite.min(), finite.max())
+    if not encode_channel(ch):
+        return None
+    return ch
+
+# sort, resample, and encode a single channel without printing progress
+# returns False if the channel could not be encoded
+def process_channel(ch, mode=RESAMPLE_MODE):
+    sort_points(ch)
+    set_sample_rate(ch)
+    fit_time_axis(ch, mode)
+    return encode_channel(ch)
+
+def sort_points(ch):
+    # sort points by timestamp, keeping packets with equal timestamps in file order
+    ch['points'] = ch['points'][np.argsort(ch['points'][:,0], kind='stable')]
+    # timestamps = ch['points'][:,0]
+    # values     = ch['points'][:,1]
+
+    ch['t_min'] = ch['points'][0,0]
+    ch['t_max'] = ch['points'][-1,0]
+    ch['v_min'] = ch['points'][:,1].min()
+    ch['v_max'] = ch['points'][:,1].max()
+
+def set_sample_rate(ch):
+    # single datapoint: use 1Hz by default
+    if ch['n_points'] == 1:
+        ch['delta_ms'] = 1000
+        ch['frequency_hz'] = 1
+    # multiple datapoints: calculate an appropriate frequency
+    else:
+        # get time delta between points
+        deltas = np.diff(ch['points'][:,0])
+        # remove deltas above 100ms (minimum frequency = 10Hz)
+        deltas = deltas[deltas <= 100]
+        # or below 1ms (maximum frequency = 1000Hz)
+        deltas = deltas[deltas >= 1]
+        if len(deltas) == 0:
+            delta = 100
         else:
-            # find the closest value of 8*10^x to abs_max
-            x = math.floor(math.log10(abs_max / 8))
-            # limit to x >= -3 (max shift/decimal places of 9)
-            # lower abs_max -> lower x (higher shift), limit prevents encoded values from overflowing
-            x = max(x, -3)
-            # find scale to map abs_max to 8*10^x
-            scale = (8 * 10**x) / abs_max
-            # find shift to map abs_max to 8*10^6
-            shift = 6 - x
-            # float scale -> fraction, limit scalar & divisor to 12 bits (required by .ld format)
-            # idk why but mapping to 8*10^x causes fewer fraction failures than 10^x
-            scalar, divisor = Fraction(scale).limit_denominator(0x7FF).as_integer_ratio()
-            if scalar > 0x7FF:
-                # encoding failed, remove channel
-                print(f"WARNING: failed to encode channel: {ch['name']} ({id}) abs_max={abs_max}")
-                del channels[id]
+            # find the most common delta
+            unique_deltas, counts = np.unique(deltas, return_counts=True)
+            delta = int(unique_deltas[counts == counts.max()].min())
+        # round so that frequency is an integer
+        while 1000 % delta != 0: delta += 1
+        ch['delta_ms'] = delta
+        ch['frequency_hz'] = math.trunc(1000 / delta)
+    # calculate sample count needed to reach final datapoint at this frequency
+    ch['sample_count'] = math.trunc(ch['t_max'] / ch['delta_ms'])
+
+def fit_time_axis(ch, mode=RESAMPLE_MODE):
+    # create a new time axis with this channel's time delta and sample count
+    ch['t_int'] = np.arange(ch['sample_count'], dtype=np.float64) * ch['delta_ms']
+    ch['v_int'] = resample(ch['points'], ch['t_int'], mode)
+
+# sample points (sorted by timestamp) at each time in t
+# "hold" uses the last point with a timestamp less than t (or the first point),
+# this produces a curve that sometimes slightly lags the recorded data
+# "linear" interpolates between the points on either side of t
+# "nearest" uses the point with the closest timestamp, preferring the earlier point on ties
+def resample(points, t, mode=RESAMPLE_MODE):
+    timestamps = points[:,0]
+    values = points[:,1]
+    if mode == 'hold':
+        i = np.searchsorted(timestamps, t, side='left') - 1
+        return values[np.maximum(i, 0)]
+    elif mode == 'linear':
+        return np.interp(t, timestamps, values)
+    elif mode == 'nearest':
+        # i is the first point at or after t
+        i = np.minimum(np.searchsorted(timestamps, t, side='left'), len(timestamps) - 1)
+        prev = np.maximum(i - 1, 0)
+        closer = np.abs(timestamps[prev] - t) <= np.abs(timestamps[i] - t)
+        return values[np.where(closer, prev, i)]
+    else:
+        raise Exception(f'ERROR: unknown resample mode "{mode}", expected one of {RESAMPLE_MODES}')
+
+# resample a channel's evenly spaced v_int at each time in t
+# gives the same result as resample() on its t_int, but finds samples by index arithmetic instead of searching
+def align(ch, t, mode=RESAMPLE_MODE):
+    if mode == 'linear':
+        return np.interp(t, ch['t_int'], ch['v_int'])
+    k = t / ch['delta_ms']
+    if mode == 'hold':
+        i = np.ceil(k) - 1
+    elif mode == 'nearest':
+        i = np.where(k - np.floor(k) <= 0.5, np.floor(k), np.ceil(k))
+    else:
+        raise Exception(f'ERROR: unknown resample mode "{mode}", expected one of {RESAMPLE_MODES}')
+    return ch['v_int'][np.clip(i, 0, ch['sample_count'] - 1).astype(np.int64)]
+
+# returns False if the channel's values can't be encoded
+def encode_channel(ch):
+    if not find_encoding(ch):
+        return False
+    ch['v_enc'], n_overflow = encode(ch['v_int'], ch)
+    if n_overflow > 0:
+        print(f"WARNING: clipped {n_overflow} values that overflowed a s32: {ch['name']} ({ch['id']})")
+    return True
+
+# find shift, scalar, and divisor to fit the channel's values in a s32
+# returns False if the channel's values can't be encoded
+def find_encoding(ch):
+    abs_max = max(abs(ch['v_min']), abs(ch['v_max']))
+
+    # encoded_value = value / 10^-shift / scalar * divisor
+    if abs_max == 0:
+        ch['shift'], ch['scalar'], ch['divisor'] = (9, 1, 1)
+    else:
+        # find the closest value of 8*10^x to abs_max
+        x = math.floor(math.log10(abs_max / 8))
+        # limit to x >= -3 (max shift/decimal places of 9)
+        # lower abs_max -> lower x (higher shift), limit prevents encoded values from overflowing
+        x = max(x, -3)
+        # find scale to map abs_max to 8*10^x
+        scale = (8 * 10**x) / abs_max
+        # find shift to map abs_max to 8*10^6
+        shift = 6 - x
+        # float scale -> fraction, limit scalar & divisor to 12 bits (required by .ld format)
+        # idk why but mapping to 8*10^x causes fewer fraction failures than 10^x
+        scalar, divisor = Fraction(scale).limit_denominator(0x7FF).as_integer_ratio()
+        if scalar > 0x7FF:
+            # encoding failed, remove channel
+            print(f"WARNING: failed to encode channel: {ch['name']} ({ch['id']}) abs_max={abs_max}")
+            return False
+
+        ch['shift'], ch['scalar'], ch['divisor'] = (shift, scalar, divisor)
+    return True
+
+# encode values with a channel's shift, scalar, and divisor
+# anything that doesn't fit in a s32 is clipped instead of letting the cast wrap
+# returns the encoded values and the number that were clipped
+def encode(values, ch):
+    scaled = values / 10**-ch['shift'] / ch['scalar'] * ch['divisor']
+    # values are truncated towards zero, so anything strictly between INT32_MIN - 1 and INT32_MAX + 1 fits
+    overflow = ~((scaled > INT32_MIN - 1) & (scaled < INT32_MAX + 1))
+    n_overflow = int(overflow.sum())
+    if n_overflow > 0:
+        scaled = np.clip(np.nan_to_num(scaled, nan=0), INT32_MIN, INT32_MAX)
+    return (scaled.astype(np.int32), n_overflow)
+
+# resample and encode a channel (after find_encoding) a chunk of its time axis at a time
+# yields arrays of encoded values without keeping the whole time axis in memory
+def encoded_chunks(ch, mode=RESAMPLE_MODE, chunk_size=ENCODE_CHUNK_SIZE):
+    n_overflow = 0
+    for lo in range(0, ch['sample_count'], chunk_size):
+        hi = min(lo + chunk_size, ch['sample_count'])
+        t = np.arange(lo, hi, dtype=np.float64) * ch['delta_ms']
+        encoded, n = encode(resample(ch['points'], t, mode), ch)
+        n_overflow += n
+        yield encoded
+    if n_overflow > 0:
+        print(f"WARNING: clipped {n_overflow} values that overflowed a s32: {ch['name']} ({ch['id']})")
+
+# find the ID of every packet that is long enough to have a timestamp and ID
+# returns the indexes of those packets and their IDs
+def packet_ids(packets, first, lengths):
+    candidates = np.flatnonzero(lengths >= 6)
+    return (candidates, records_at(packets, np.dtype('>u2'), 4)[first[candidates]])
+
+# check the checksum of packets with at least 2 bytes
+# the checksum is the last byte, the sum of every other byte (ignoring overflow) including the start delimiter
+def checksums_valid(packets, first, lengths):
+    if len(first) == 0:
+        return np.zeros(0, dtype=bool)
+    last = first + lengths - 1
+    # summing a uint8 array wraps around, which is the same as ignoring overflow
+    bounds = np.column_stack((first, last)).ravel()
+    sums = np.add.reduceat(packets, bounds, dtype=np.uint8)[::2] + np.uint8(START)
+    return sums == packets[last]
+
+# running index of a .gdat file's packets by ID, built from consecutive segments of the file
+class PacketIndex:
+    def __init__(self):
+        self.offsets = {}
+        self.raw_lengths = {}
+        self.n_packets = 0
+
+    # index the packets in buf (a uint8 array), a segment of the file beginning at offset pos
+    # segments must begin at the start of the data or right after a start delimiter, and end right before one
+    # (except for the last), which matches how bytes.split(START) counts packets
+    def add(self, buf, pos):
+        packets, first, raw, lengths = split_packets(buf)
+        self.n_packets += len(first)
+        indexed, ids = packet_ids(packets, first, lengths)
+        # raw lengths are stored in 16 bits, anything longer is garbage
+        short = raw[indexed] <= 0xFFFF
+        indexed = indexed[short]
+        ids = ids[short]
+        order = np.argsort(ids, kind='stable')
+        ids = ids[order]
+        indexed = indexed[order]
+        edges = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1, [len(ids)]))
+        for (lo, hi) in zip(edges[:-1], edges[1:]):
+            if lo == hi:
                 continue
-            
-            ch['shift'], ch['scalar'], ch['divisor'] = (shift, scalar, divisor)
+            id = int(ids[lo])
+            self.offsets.setdefault(id, Buffer(dtype=np.int64)).append(first[indexed[lo:hi]] + pos)
+            self.raw_lengths.setdefault(id, Buffer(dtype=np.uint16)).append(raw[indexed[lo:hi]])
+
+    # returns a dictionary of ID -> (file offsets, raw lengths) in file order
+    def index(self):
+        return {id: (self.offsets[id].array(), self.raw_lengths[id].array()) for id in self.offsets}
+
+    # the index so far, viewed without trimming the buffers so that adding to it stays cheap
+    def view(self):
+        return {id: (self.offsets[id].view(), self.raw_lengths[id].view()) for id in self.offsets}
+
+# index the packets in data[start:end] (a uint8 array, e.g. a memory-mapped .gdat) by ID
+# includes every packet with a timestamp and ID, whether or not its ID, size, or checksum is valid
+# returns a dictionary of ID -> (file offsets, raw lengths) in file order and the number of packets
+def index_packets(data, start, end, chunk_size=CHUNK_SIZE):
+    index = PacketIndex()
+    pos = start
+    while True:
+        size = chunk_size
+        while True:
+            # only index up to the last start delimiter, the final packet may continue in the next chunk
+            # the delimiter itself is skipped, matching how bytes.split(START) counts packets
+            if pos + size >= end:
+                (seg_end, next_pos) = (end, None)
+                break
+            i = np.flatnonzero(data[pos:pos+size] == START)
+            if len(i) > 0:
+                (seg_end, next_pos) = (pos + i[-1], pos + i[-1] + 1)
+                break
+            size *= 2
+        index.add(np.asarray(data[pos:seg_end]), pos)
+        if next_pos is None:
+            break
+        pos = next_pos
+    return (index.index(), index.n_packets)
 
-        # encode values
-        ch['v_enc'] = np.array(
-            [v / 10**-ch['shift'] / ch['scalar'] * ch['divisor'] for v in ch['v_int']],
-            dtype=np.int32
+# copy raw (escaped) packets out of a uint8 array, e.g. a memory-mapped .gdat
+# returns one array with each packet preceded by a start delimiter, ready to write to a .gdat
+def gather_packets(data, offsets, raw_lengths):
+    raw_lengths = raw_lengths.astype(np.int64)
+    # position of each packet's first byte in the output
+    dest = np.cumsum(raw_lengths + 1) - raw_lengths
+    within = np.arange(raw_lengths.sum()) - np.repeat(np.cumsum(raw_lengths) - raw_lengths, raw_lengths)
+    packets = np.full(int((raw_lengths + 1).sum()), START, dtype=np.uint8)
+    packets[np.repeat(dest, raw_lengths) + within] = data[np.repeat(offsets, raw_lengths) + within]
+    return packets
+
+# packet indexes can be saved next to a .gdat as "<name>.gdat.idx" so they don't need to be rebuilt
+def index_path(path):
+    path = Path(path)
+    return path.with_name(path.name + '.idx')
+
+# save a packet index (see index_packets) for a .gdat file
+# the index covers the file's first `size` bytes, the whole file by default
+# an index of part of a file (e.g. one that's still being recorded) must end right before a start delimiter
+# stores the file's modification time and a checksum of the covered data's start and end,
+# so that a stale index is ignored but an index of a file that has since grown can still be used
+def save_index(path, index, n_packets, size=None):
+    stat = os.stat(path)
+    if size is None:
+        size = stat.st_size
+    ids = np.array(list(index.keys()), dtype=np.uint16)
+    counts = np.array([len(offsets) for (offsets, _) in index.values()], dtype=np.int64)
+    # write to a temporary file first so that an index is never left partially written
+    tmp = index_path(path).with_name(index_path(path).name + '.tmp')
+    with open(tmp, 'wb') as f:
+        np.savez(
+            f,
+            size=size,
+            mtime=stat.st_mtime_ns,
+            check=index_check(path, size),
+            n_packets=n_packets,
+            ids=ids,
+            counts=counts,
+            offsets=np.concatenate([offsets for (offsets, _) in index.values()] or [np.zeros(0, np.int64)]),
+            raw_lengths=np.concatenate([raw for (_, raw) in index.values()] or [np.zeros(0, np.uint16)]),
         )
-    elapsed = round(time.time() - start, 2)
-    print(f'({elapsed}s)')
+    os.replace(tmp, index_path(path))
 
-    print(f'created {len(channels)} channels')
-    return channels
+# checksum of the first and last INDEX_CHECK_SIZE bytes of a file's first `size` bytes
+def index_check(path, size):
+    with open(path, 'rb') as f:
+        head = f.read(min(size, INDEX_CHECK_SIZE))
+        f.seek(max(size - INDEX_CHECK_SIZE, 0))
+        tail = f.read(min(size, INDEX_CHECK_SIZE))
+    return zlib.crc32(head + tail)
+
+# load the saved packet index of a .gdat file
+# if the file has grown since the index was saved (by appending to it), packets after the indexed part are indexed now
+# returns (index, n_packets), or None if there is no usable index or the file has changed since it was saved
+def load_index(path):
+    try:
+        stat = os.stat(path)
+        with np.load(index_path(path)) as npz:
+            size = int(npz['size'])
+            if stat.st_size == size:
+                if int(npz['mtime']) != stat.st_mtime_ns:
+                    return None
+            elif stat.st_size < size or int(npz['check']) != index_check(path, size):
+                return None
+            bounds = np.cumsum(npz['counts'])[:-1]
+            index = {
+                int(id): (offsets, raw)
+                for (id, offsets, raw) in zip(
+                    npz['ids'], np.split(npz['offsets'], bounds), np.split(npz['raw_lengths'], bounds)
+                )
+            }
+            n_packets = int(npz['n_packets'])
+        if stat.st_size > size:
+            data = np.memmap(path, dtype=np.uint8, mode='r')
+            if data[size] != START:
+                return None
+            # the delimiter itself is skipped, like index_packets does between chunks
+            tail, n_tail = index_packets(data, size + 1, len(data))
+            for (id, (offsets, raw)) in tail.items():
+                (o, r) = index.get(id, (np.zeros(0, np.int64), np.zeros(0, np.uint16)))
+                index[id] = (np.concatenate((o, offsets)), np.concatenate((r, raw)))
+            n_packets += n_tail
+        return (index, n_packets)
+    except Exception:
+        # an unreadable or corrupt index is rebuilt like a missing one
+        return None
+
+# a memory-mapped .gdat file
+# packets are indexed by parameter ID when the file is opened,
+# each channel is decoded, resampled, and encoded the first time it is accessed
+# if the file's points are in the disk cache (see lib/cache.py), they are used instead of the index,
+# otherwise they're added to the cache when the file is opened
+class GdatFile:
+    def __init__(self, path, parameters, chunk_size=CHUNK_SIZE, use_cache=True, mode=RESAMPLE_MODE):
+        self.path = path
+        self.parameters = parameters
+        self.mode = mode
+        self.use_cache = use_cache
+        self.index = {}
+        self.decoded = {}   # ID -> points, from the disk cache or decoded when a channel is accessed
+        self.processed = {} # ID -> channel (None if it has no data or failed to encode)
+
+        cached = cache.load(path, parameters) if use_cache else None
+        self.cached = cached is not None
+        if self.cached:
+            self.t0, self.decoded, self.n_packets, _ = cached
+            return
+
+        # np.memmap can't map an empty file
+        if os.path.getsize(path) > 0:
+            self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            self.data = np.zeros(0, dtype=np.uint8)
+        with open(path, 'rb') as f:
+            (sof, self.data_start) = read_header(f, chunk_size)
+        self.t0 = get_t0(sof)
+        indexed = load_index(path)
+        if indexed is None:
+            indexed = index_packets(self.data, self.data_start, len(self.data), chunk_size)
+        self.index, self.n_packets = indexed
+        if use_cache:
+            self.store_cache()
+
+    # decode every channel, one at a time, and add the file's points to the disk cache
+    # so that opening the file again (e.g. in the next session) skips indexing and decoding
+    def store_cache(self):
+        print('caching decoded points... ', end='', flush=True)
+        start = time.time()
+        cache.store(self.path, self.parameters, self.t0, self.decoded_points(), self.n_packets)
+        elapsed = round(time.time() - start, 2)
+        print(f'({elapsed}s)')
+
+    # yields (ID, points) for every parameter with valid packets, in file order
+    def decoded_points(self):
+        for id in self.parameters:
+            if self.packet_count(id) > 0:
+                points, _ = self.points(id)
+                if len(points) > 0:
+                    yield (id, points)
+
+    # number of packets indexed (or points cached) for a parameter
+    def packet_count(self, id):
+        if id in self.index:
+            return len(self.index[id][0])
+        return len(self.decoded.get(id, []))
+
+    # decode the indexed packets of a parameter
+    # returns [(timestamp, value), ...] and the number of packets that failed to decode
+    def points(self, id):
+        if id in self.decoded:
+            return (self.decoded[id], 0)
+        if id not in self.index or id not in self.parameters:
+            return (np.empty((0, 2)), 0)
+        # copy the packets out of the file, dropping the first start delimiter to count packets like split()
+        data = gather_packets(self.data, *self.index[id])[1:]
+        timestamps, _, values, n_packets, n_errors = decode_packets(data, {id: self.parameters[id]})
+        return (np.column_stack((timestamps, values)), n_errors)
+
+    # get a decoded, resampled, and encoded channel
+    # returns None if the parameter has no data or the channel could not be encoded
+    def channel(self, id):
+        if id not in self.processed:
+            ch = None
+            if id in self.parameters and self.packet_count(id) > 0:
+                points, _ = self.points(id)
+                if len(points) > 0:
+                    ch = new_channel(id, self.parameters[id], points)
+                    ok = process_channel(ch, self.mode)
+                    self.decoded[id] = ch['points']
+                    if not ok:
+                        ch = None
+            self.processed[id] = ch
+        return self.processed[id]
+
+    # convert to a .ld one channel at a time, streaming each channel's encoded samples to disk
+    # only one channel's points are held in memory at once (plus any channels that were already accessed)
+    # math_channels are written after the parameter channels (see create_math_channels),
+    # their input channels are fully resampled and kept in memory
+    def write_ld(self, path, math_channels={}):
+        ids = [id for id in self.parameters if self.packet_count(id) > 0]
+        if len(ids) == 0:
+            raise Exception('ERROR: no channels to convert')
+        n_channels = 0
+        with ld.Writer(path, self.t0, len(ids) + len(math_channels)) as writer:
+            for id in ids:
+                if id in self.processed:
+                    ch = self.processed[id]
+                    if ch is not None and writer.add_channel(ch, [ch['v_enc']]):
+                        n_channels += 1
+                    continue
+                points, _ = self.points(id)
+                if len(points) == 0:
+                    continue
+                ch = new_channel(id, self.parameters[id], points)
+                sort_points(ch)
+                set_sample_rate(ch)
+                if not find_encoding(ch):
+                    continue
+                if writer.add_channel(ch, encoded_chunks(ch, self.mode)):
+                    n_channels += 1
+            if len(math_channels) > 0:
+                inputs = {id for definition in math_channels.values() for id in expr.Expression(definition['equation']).inputs}
+                channels = {id: self.channel(id) for id in inputs if self.channel(id) is not None}
+                for ch in create_math_channels(math_channels, channels, self.mode).values():
+                    if writer.add_channel(ch, [ch['v_enc']]):
+                        n_channels += 1
+        print(f'wrote {n_channels} channels')
 
 # plot a channel parsed from a .gdat string
 def plot(ch):
@@ -221,11 +1002,13 @@ def plot(ch):
     plt.xlabel('time (ms)')
     plt.ylabel(ch['unit'])
 
-    plt.plot(ch['points'][:,0], ch['points'][:,1], '.', label='raw')
-    plt.plot(ch['t_int'], ch['v_int'], '-', label='interpolated')
+    # long channels are decimated to the width of the plot, and redrawn at full detail when zoomed in
+    ax = plt.gca()
+    decimate.plot(ax, ch['points'][:,0], ch['points'][:,1], '.', label='raw')
+    decimate.plot(ax, ch['t_int'], ch['v_int'], '-', label='interpolated')
 
-    decoded = [v * 10**-ch['shift'] * ch['scalar'] / ch['divisor'] for v in ch['v_enc']]
-    plt.plot(ch['t_int'], decoded, '--', label='decoded')
+    decoded = ch['v_enc'] * 10.0**-ch['shift'] * ch['scalar'] / ch['divisor']
+    decimate.plot(ax, ch['t_int'], decoded, '--', label='decoded')
 
     plt.ticklabel_format(useOffset=False)
     plt.legend(loc='best')
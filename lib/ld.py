@@ -1,7 +1,13 @@
+import os
+import mmap
 import struct
 import time
+import weakref
 import numpy as np
 import matplotlib.pyplot as plt
+from collections import OrderedDict
+
+from lib import decimate
 
 # file structure based on logs from the MoTeC EDL3 v5.6
 
@@ -177,82 +183,159 @@ CH_META_SIZE = struct.calcsize(CH_META_FMT)
 
 # ==============================================================================
 
+LD_CACHE_SIZE = 512 * 1024 * 1024 # bytes of scaled channel data an LdFile keeps in memory
+
 # read values from a .ld file according to the formats above
+# returns (metadata, channels) with every channel's data loaded, see LdFile to load channels on demand
+# the data is copied out of the file, which is closed before returning
 def parse(path):
-    f = open(path, 'rb')
+    channels = {}
+    with LdFile(path) as ld_file:
+        for (name, ch) in ld_file.channels.items():
+            channels[name] = dict(ch)
+            if name not in ld_file.errors:
+                raw = np.array(ld_file.raw(name))
+                channels[name]['raw'] = raw
+                channels[name]['data'] = scale(raw, ch)
+    return (ld_file.metadata, channels)
+
+# a channel's metadata, raw and scaled data ('raw' and 'data') are read from its file when accessed
+# only a weak reference to the file is kept, so channels don't keep a file (and its memory map) alive
+class LdChannel(dict):
+    def __init__(self, file, meta):
+        super().__init__(meta)
+        self.file = weakref.ref(file)
+
+    def __missing__(self, key):
+        if key not in ('raw', 'data'):
+            raise KeyError(key)
+        file = self.file()
+        if file is None:
+            raise Exception(f"ERROR: the file of channel \"{self['name']}\" has been released")
+        if key == 'raw':
+            return file.raw(self['name'])
+        return file.data(self['name'])
+
+# a memory-mapped .ld file
+# opening only reads metadata, channel data is scaled when first accessed and kept in an LRU cache
+# the file stays open until close() (or the end of a with block), which is needed to replace it on Windows
+class LdFile:
+    def __init__(self, path, cache_size=LD_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # name -> scaled data, least recently used first
+        self.cached_bytes = 0
+
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise Exception(f'ERROR: {path} is empty')
+            # the map stays open until close(), raw channel data is viewed from it in place
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try: header = self.unpack(0, HEADER_KEYS, HEADER_FMT)
+        except: print('ERROR: failed to unpack header')
+
+        try: event = self.unpack(header['event_ptr'], EVENT_KEYS, EVENT_FMT)
+        except: print('WARNING: failed to unpack event')
+
+        try: venue = self.unpack(event['venue_ptr'], VENUE_KEYS, VENUE_FMT)
+        except: print('WARNING: failed to unpack venue')
+
+        try: vehicle = self.unpack(venue['vehicle_ptr'], VEHICLE_KEYS, VEHICLE_FMT)
+        except: print('WARNING: failed to unpack vehicle')
+
+        try: weather = self.unpack(event['weather_ptr'], WEATHER_KEYS, WEATHER_FMT)
+        except: print('WARNING: failed to unpack weather')
+
+        self.channels = {}
+        self.dtypes = {} # name -> numpy type of each sample
+        self.errors = {} # name -> reason the channel's data can't be read
+        next_ch = header['meta_ptr']
+        while next_ch:
+            ch = self.unpack(next_ch, CH_META_KEYS, CH_META_FMT)
+            ch['meta_ptr'] = next_ch # not included in the format, but useful to keep
+            next_ch = ch['next_ptr']
+
+            # check for duplicate channel
+            if ch['name'] in self.channels:
+                print(f"WARNING: ignoring duplicate channel \"{ch['name']}\"")
+                continue
+
+            # get type of each sample
+            if ch['size'] == 2:
+                self.dtypes[ch['name']] = '<i2'
+            elif ch['size'] == 4:
+                self.dtypes[ch['name']] = '<i4'
+            else:
+                self.errors[ch['name']] = f"\"{ch['name']}\" has unknown data size ({ch['size']})"
+            if ch['name'] not in self.errors and ch['data_ptr'] + ch['sample_count'] * ch['size'] > len(self.buf):
+                self.errors[ch['name']] = f"\"{ch['name']}\" data is out of bounds"
+            if ch['name'] in self.errors:
+                print(f"WARNING: {self.errors[ch['name']]}")
+
+            self.channels[ch['name']] = LdChannel(self, ch)
+
+        if len(self.channels) != header['num_channels']:
+            print(f"WARNING: num_channels ({header['num_channels']}) does not match number of channels found ({len(self.channels)})")
+
+        print(f'loaded {len(self.channels)} channels')
+        self.metadata = {
+            'header': header,
+            'event': event,
+            'venue': venue,
+            'vehicle': vehicle,
+            'weather': weather
+        }
+
+    def __enter__(self):
+        return self
 
-    def unpack(offset, keys, format):
-        nonlocal f
-        f.seek(offset)
-        data = f.read(struct.calcsize(format))
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # release the memory map and cached data, raw data viewed from the file can't be in use
+    def close(self):
+        self.cache.clear()
+        self.cached_bytes = 0
+        self.buf.close()
+
+    def unpack(self, offset, keys, format):
         # unpack bytes according to format, decoding & trimming strings
         values = [
             value.decode().strip().strip('\0') if type(value) is bytes
             else value
-            for value in struct.unpack(format, data)
+            for value in struct.unpack_from(format, self.buf, offset)
         ]
         # match keys to the unpacked values, ignoring empty keys
         return {k:v for k,v in zip(keys, values) if k != ''}
 
-    try: header = unpack(0, HEADER_KEYS, HEADER_FMT)
-    except: print('ERROR: failed to unpack header')
-
-    try: event = unpack(header['event_ptr'], EVENT_KEYS, EVENT_FMT)
-    except: print('WARNING: failed to unpack event')
-
-    try: venue = unpack(event['venue_ptr'], VENUE_KEYS, VENUE_FMT)
-    except: print('WARNING: failed to unpack venue')
-
-    try: vehicle = unpack(venue['vehicle_ptr'], VEHICLE_KEYS, VEHICLE_FMT)
-    except: print('WARNING: failed to unpack vehicle')
-
-    try: weather = unpack(event['weather_ptr'], WEATHER_KEYS, WEATHER_FMT)
-    except: print('WARNING: failed to unpack weather')
-
-    channels = {}
-    next_ch = header['meta_ptr']
-    while next_ch:
-        ch = unpack(next_ch, CH_META_KEYS, CH_META_FMT)
-        ch['meta_ptr'] = next_ch # not included in the format, but useful to keep
-        next_ch = ch['next_ptr']
-
-        # check for duplicate channel
-        if ch['name'] in channels:
-            print(f"WARNING: ignoring duplicate channel \"{ch['name']}\"")
-            continue
-        else:
-            channels[ch['name']] = ch
-
-        # get format for entire data section
-        if ch['size'] == 2:
-            data_fmt = f"<{ch['sample_count']}h"
-        elif ch['size'] == 4:
-            data_fmt = f"<{ch['sample_count']}i"
-        else:
-            print(f"WARNING: \"{ch['name']}\" has unknown data size ({ch['size']})")
-            continue
-
-        # jump to and unpack channel data
-        f.seek(ch['data_ptr'])
-        data = f.read(struct.calcsize(data_fmt))
-        channels[ch['name']]['data'] = [
-            v * 10**-ch['shift'] * ch['scalar'] / ch['divisor']
-            for v in struct.unpack(data_fmt, data)
-        ]
-
-    if len(channels) != header['num_channels']:
-        print(f"WARNING: num_channels ({header['num_channels']}) does not match number of channels found ({len(channels)})")
-
-    f.close()
-    print(f'loaded {len(channels)} channels')
-    metadata = {
-        'header': header,
-        'event': event,
-        'venue': venue,
-        'vehicle': vehicle,
-        'weather': weather
-    }
-    return (metadata, channels)
+    # view a channel's encoded data in place
+    def raw(self, name):
+        if self.buf.closed:
+            raise Exception(f'ERROR: {self.path} is closed')
+        if name in self.errors:
+            raise Exception(f'ERROR: {self.errors[name]}')
+        ch = self.channels[name]
+        return np.frombuffer(self.buf, dtype=self.dtypes[name], count=ch['sample_count'], offset=ch['data_ptr'])
+
+    # get a channel's scaled data, evicting least recently used channels to stay under cache_size
+    def data(self, name):
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+        data = scale(self.raw(name), self.channels[name])
+        self.cache[name] = data
+        self.cached_bytes += data.nbytes
+        # always keep the channel that was just loaded
+        while self.cached_bytes > self.cache_size and len(self.cache) > 1:
+            (_, evicted) = self.cache.popitem(last=False)
+            self.cached_bytes -= evicted.nbytes
+        return data
+
+# decode raw channel data
+# value = encoded_value * 10^-shift * scalar / divisor
+def scale(raw, ch):
+    return raw.astype(np.float64) * 10**-ch['shift'] * ch['scalar'] / ch['divisor']
 
 # plot a channel parsed from a .ld file
 def plot(ch):
@@ -261,8 +344,9 @@ def plot(ch):
     plt.xlabel('time (s)')
     plt.ylabel(ch['unit'])
 
+    # long channels are decimated to the width of the plot, and redrawn at full detail when zoomed in
     t = np.arange(0, ch['sample_count']) * (1 / ch['sample_rate'])
-    plt.plot(t, ch['data'], '.')
+    decimate.plot(plt.gca(), t, ch['data'], '.')
 
     plt.ticklabel_format(useOffset=False)
     plt.show()
@@ -270,126 +354,64 @@ def plot(ch):
 # create a .ld file with the provided channels and timestamp and default metadata
 # see gdat.py for channel data structure
 def write(path, channels, t0):
-    event_offset = HEADER_SIZE
-    venue_offset = event_offset + EVENT_SIZE
-    vehicle_offset = venue_offset + VENUE_SIZE
-    weather_offset = vehicle_offset + VEHICLE_SIZE
-    meta_offset = weather_offset + WEATHER_SIZE
-    data_offset = meta_offset + (len(channels) * CH_META_SIZE)
-
-    # order must match HEADER_FMT
-    header_values = {
-        'sof': 0x40,
-        'meta_ptr': meta_offset,
-        'data_ptr': data_offset,
-        'event_ptr': event_offset,
-        'magic1': 0,
-        'magic2': 0x4240,
-        'magic3': 0x000F,
-        'device_serial': 21115,
-        'device_type': 'ADL',
-        'device_version': 560,
-        'magic4': 0x0080,
-        'num_channels': len(channels),
-        'num_channels2': len(channels),
-        'magic5': 0x00050014,
-        'date': time.strftime('%d/%m/%Y', t0),
-        'time': time.strftime('%H:%M:%S', t0),
-        'driver': 'Driver',
-        'vehicle_id': 'VehicleID',
-        'engine_id': '',
-        'venue': 'Venue',
-        'magic6': 0x02B09201,
-        'session': 'Session',
-        'short_comment': 'Comment',
-        'magic7': 0x0045,
-        'team': ''
-    }
-
-    # order must match EVENT_FMT
-    event_values = {
-        'event': 'Event',
-        'session': 'Session',
-        'long_comment': '',
-        'venue_ptr': venue_offset,
-        'weather_ptr': weather_offset
-    }
-
-    # order must match VENUE_FMT
-    venue_values = {
-        'venue': 'Venue',
-        'venue_length': 0,
-        'vehicle_ptr': vehicle_offset,
-        'venue_category': ''
-    }
-
-    # order must match VEHICLE_FMT
-    vehicle_values = {
-        'vehicle_id': 'VehicleID',
-        'vehicle_desc': '',
-        'engine_id': '',
-        'vehicle_weight': 0,
-        'fuel_tank': 0,
-        'vehicle_type': '',
-        'driver_type': '',
-        'diff_ratio': 0,
-        'gear1': 0,
-        'gear2': 0,
-        'gear3': 0,
-        'gear4': 0,
-        'gear5': 0,
-        'gear6': 0,
-        'gear7': 0,
-        'gear8': 0,
-        'gear9': 0,
-        'gear10': 0,
-        'vehicle_track': 0,
-        'vehicle_wheelbase': 0,
-        'vehicle_comment': '',
-        'vehicle_number': ''
-    }
-
-    # order must match WEATHER_FMT
-    weather_values = {
-        'sky': 'Sunny',
-        'air_temp': '',
-        'air_temp_unit': '',
-        'track_temp': '',
-        'track_temp_unit': '',
-        'pressure': '',
-        'pressure_unit': '',
-        'humidity': '',
-        'humidity_unit': '',
-        'wind_speed': '',
-        'wind_speed_unit': '',
-        'wind_direction': '',
-        'weather_comment': ''
-    }
-
-    # convert strings to utf-8 byte strings
-    def enc_str(values):
-        return [
-            value.encode() if type(value) is str else value
-            for value in values
-        ]
-
-    print('packing metadata...')
-    header = struct.pack(HEADER_FMT, *enc_str(header_values.values()))
-    event = struct.pack(EVENT_FMT, *enc_str(event_values.values()))
-    venue = struct.pack(VENUE_FMT, *enc_str(venue_values.values()))
-    vehicle = struct.pack(VEHICLE_FMT, *enc_str(vehicle_values.values()))
-    weather = struct.pack(WEATHER_FMT, *enc_str(weather_values.values()))
-
-    print('linking channels...')
-    channel_metadata = b''
-    data_size = 0
-    for i, ch in enumerate(channels.values()):
+    with Writer(path, t0, len(channels)) as writer:
+        for ch in channels.values():
+            writer.add_channel(ch, [ch['v_enc']])
+
+# convert strings to utf-8 byte strings
+def enc_str(values):
+    return [
+        value.encode() if type(value) is str else value
+        for value in values
+    ]
+
+# writes a .ld file one channel at a time
+# space for metadata is reserved up front, channel data is streamed to disk as it's produced,
+# then metadata (with each channel's data_ptr and sample_count) is written when the writer is closed
+class Writer:
+    def __init__(self, path, t0, n_channels):
+        self.path = path
+        self.t0 = t0
+        self.n_channels = n_channels # metadata slots to reserve, more channels can't be added
+        self.channels = [] # metadata of channels added so far, see CH_META
+
+        self.event_offset = HEADER_SIZE
+        self.venue_offset = self.event_offset + EVENT_SIZE
+        self.vehicle_offset = self.venue_offset + VENUE_SIZE
+        self.weather_offset = self.vehicle_offset + VEHICLE_SIZE
+        self.meta_offset = self.weather_offset + WEATHER_SIZE
+        self.data_offset = self.meta_offset + (n_channels * CH_META_SIZE)
+
+        print(f'writing to "{path}"... ', end='', flush=True)
+        self.start = time.time()
+        self.f = open(path, 'wb')
+        self.f.seek(self.data_offset)
+        self.data_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # don't leave a partially written file behind
+            self.f.close()
+            os.remove(self.path)
+            print('(failed)')
+
+    # write a channel's s32 encoded samples, provided as an iterable of arrays (e.g. one chunk at a time)
+    # ch provides name, unit, frequency_hz, shift, scalar, divisor, and offset
+    # returns False (without writing anything) if the channel's metadata doesn't fit the .ld format
+    def add_channel(self, ch, chunks):
+        if len(self.channels) == self.n_channels:
+            raise Exception(f'ERROR: {self.path} only has space for {self.n_channels} channels')
         # order must match CH_META_FMT
         ch_meta = {
             'prev_ptr': 0,
             'next_ptr': 0,
-            'data_ptr': data_offset + data_size,
-            'sample_count': len(ch['v_enc']),
+            'data_ptr': self.data_offset + self.data_size,
+            'sample_count': 0,
             'magic1': 0x0005AA55,
             'size': 0x04,
             'sample_rate': ch['frequency_hz'],
@@ -401,30 +423,139 @@ def write(path, channels, t0):
             'short_name': '',
             'unit': ch['unit'],
         }
+        # pointers are filled in when the file is closed, and always fit once data_ptr does
+        try:
+            struct.pack(CH_META_FMT, *enc_str(ch_meta.values()))
+        except struct.error as err:
+            print(f"WARNING: skipping channel that can't be written to .ld: {ch['name']} ({err})")
+            return False
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype='<i4')
+            chunk.tofile(self.f)
+            ch_meta['sample_count'] += len(chunk)
+        self.data_size += ch_meta['sample_count'] * ch_meta['size']
+        self.channels.append(ch_meta)
+        return True
+
+    # write metadata for the channels that were added and close the file
+    def close(self):
+        if self.f.closed:
+            return
+
+        # slots reserved for channels that were skipped are left as an unused gap before the data,
+        # which is fine since every channel's data_ptr is absolute
+        self.f.seek(0)
+        self.f.write(self.pack_metadata())
+        self.f.close()
+        elapsed = round(time.time() - self.start, 2)
+        print(f'({elapsed}s)')
+
+    def pack_metadata(self):
+        # order must match HEADER_FMT
+        header_values = {
+            'sof': 0x40,
+            'meta_ptr': self.meta_offset,
+            'data_ptr': self.data_offset,
+            'event_ptr': self.event_offset,
+            'magic1': 0,
+            'magic2': 0x4240,
+            'magic3': 0x000F,
+            'device_serial': 21115,
+            'device_type': 'ADL',
+            'device_version': 560,
+            'magic4': 0x0080,
+            'num_channels': len(self.channels),
+            'num_channels2': len(self.channels),
+            'magic5': 0x00050014,
+            'date': time.strftime('%d/%m/%Y', self.t0),
+            'time': time.strftime('%H:%M:%S', self.t0),
+            'driver': 'Driver',
+            'vehicle_id': 'VehicleID',
+            'engine_id': '',
+            'venue': 'Venue',
+            'magic6': 0x02B09201,
+            'session': 'Session',
+            'short_comment': 'Comment',
+            'magic7': 0x0045,
+            'team': ''
+        }
 
-        if i == 0: ch_meta['prev_ptr'] = 0 # first channel has no prev_ptr
-        else: ch_meta['prev_ptr'] = meta_offset + CH_META_SIZE * (i - 1)
+        # order must match EVENT_FMT
+        event_values = {
+            'event': 'Event',
+            'session': 'Session',
+            'long_comment': '',
+            'venue_ptr': self.venue_offset,
+            'weather_ptr': self.weather_offset
+        }
 
-        if i == len(channels) - 1: ch_meta['next_ptr'] = 0 # last channel has no next_ptr
-        else: ch_meta['next_ptr'] = meta_offset + CH_META_SIZE * (i + 1)
+        # order must match VENUE_FMT
+        venue_values = {
+            'venue': 'Venue',
+            'venue_length': 0,
+            'vehicle_ptr': self.vehicle_offset,
+            'venue_category': ''
+        }
 
-        data_size += ch_meta['sample_count'] * ch_meta['size']
+        # order must match VEHICLE_FMT
+        vehicle_values = {
+            'vehicle_id': 'VehicleID',
+            'vehicle_desc': '',
+            'engine_id': '',
+            'vehicle_weight': 0,
+            'fuel_tank': 0,
+            'vehicle_type': '',
+            'driver_type': '',
+            'diff_ratio': 0,
+            'gear1': 0,
+            'gear2': 0,
+            'gear3': 0,
+            'gear4': 0,
+            'gear5': 0,
+            'gear6': 0,
+            'gear7': 0,
+            'gear8': 0,
+            'gear9': 0,
+            'gear10': 0,
+            'vehicle_track': 0,
+            'vehicle_wheelbase': 0,
+            'vehicle_comment': '',
+            'vehicle_number': ''
+        }
 
-        try:
-            channel_metadata += struct.pack(CH_META_FMT, *enc_str(ch_meta.values()))
-        except:
-            print(f"failed to pack channel metadata ({ch['id']}): {ch_meta}")
+        # order must match WEATHER_FMT
+        weather_values = {
+            'sky': 'Sunny',
+            'air_temp': '',
+            'air_temp_unit': '',
+            'track_temp': '',
+            'track_temp_unit': '',
+            'pressure': '',
+            'pressure_unit': '',
+            'humidity': '',
+            'humidity_unit': '',
+            'wind_speed': '',
+            'wind_speed_unit': '',
+            'wind_direction': '',
+            'weather_comment': ''
+        }
 
-    print(f'writing to "{path}"... ', end='', flush=True)
-    start = time.time()
-    with open(path, 'wb') as f:
-        f.write(header + event + venue + vehicle + weather + channel_metadata)
+        header = struct.pack(HEADER_FMT, *enc_str(header_values.values()))
+        event = struct.pack(EVENT_FMT, *enc_str(event_values.values()))
+        venue = struct.pack(VENUE_FMT, *enc_str(venue_values.values()))
+        vehicle = struct.pack(VEHICLE_FMT, *enc_str(vehicle_values.values()))
+        weather = struct.pack(WEATHER_FMT, *enc_str(weather_values.values()))
 
-        # pack data for each channel
-        # do this at write time to avoid storing large byte strings in memory
-        for ch in channels.values():
-            # assumes data has been encoded for a s32
-            data = struct.pack(f"<{len(ch['v_enc'])}i", *ch['v_enc'])
-            f.write(data)
-    elapsed = round(time.time() - start, 2)
-    print(f'({elapsed}s)')
\ No newline at end of file
+        # link channels
+        channel_metadata = []
+        for i, ch_meta in enumerate(self.channels):
+            if i == 0: ch_meta['prev_ptr'] = 0 # first channel has no prev_ptr
+            else: ch_meta['prev_ptr'] = self.meta_offset + CH_META_SIZE * (i - 1)
+
+            if i == len(self.channels) - 1: ch_meta['next_ptr'] = 0 # last channel has no next_ptr
+            else: ch_meta['next_ptr'] = self.meta_offset + CH_META_SIZE * (i + 1)
+
+            # every channel's metadata was checked by add_channel, so the list is never broken
+            channel_metadata.append(struct.pack(CH_META_FMT, *enc_str(ch_meta.values())))
+
+        return b''.join([header, event, venue, vehicle, weather, *channel_metadata])
@@ -1,17 +1,21 @@
-import threading
 import socket
 import serial
 import time
-import struct
+import numpy as np
 
-START = 0x7E
-ESC = 0x7D
-ESC_XOR = 0x20
+from lib import gdat
+from lib import record
 
 BAUD = 230400
 BLOCK_SIZE = 1000 # bytes to read in each update
 TIMEOUT = 1 # seconds to wait for desired block size
 
+START = gdat.START.to_bytes(1, 'big')
+PACKET_MAX_RAW_SIZE = 2 * gdat.PACKET_MAX_SIZE # largest a packet can be if every byte is escaped
+
+RING_DEPTH = 4096 # samples kept for each parameter
+CLOCK_TOLERANCE = 5 # seconds the device clock can drift from the wall clock before t0 is re-estimated
+
 # Port is a wrapper for either a serial port or network socket
 # this allows a Node to receive and transmit data using a common interface
 class Port:
@@ -68,93 +72,173 @@ class Port:
             self.port.close()
             self.port = None
 
-# a GopherVision Node receives .gdat packets from a Port
-# and updates a dictionary of each parameter's most recent value
-# Nodes can optionally forward received data to a set of client addresses (host:port)
+# Framer reassembles .gdat packets from a stream of blocks (e.g. serial reads or UDP datagrams)
+# the partial packet at the end of each block is carried into the next one instead of being dropped
+# counts are kept of:
+#   n_bytes: bytes received
+#   n_packets: packets decoded
+#   n_errors: packets that failed to decode (checksum failures or malformed packets)
+#   n_resynced: bytes skipped while searching for a start delimiter
+class Framer:
+    def __init__(self, parameters: dict = {}):
+        self.set_parameters(parameters)
+        self.tail = b''
+        self.synced = False
+        self.n_bytes = 0
+        self.n_packets = 0
+        self.n_errors = 0
+        self.n_resynced = 0
+
+    def set_parameters(self, parameters: dict):
+        self.tables = gdat.packet_tables(parameters)
+        self.parameters = parameters
+
+    # decode every complete packet in the received data
+    # returns (timestamps, ids, values) of the valid packets, grouped by ID in the order they were received
+    def feed(self, block: bytes):
+        self.n_bytes += len(block)
+        data = self.tail + block
+        end = data.rfind(START)
+        begin = 0
+        if not self.synced and end >= 0:
+            # skip to the first start delimiter
+            begin = data.find(START) + 1
+            self.n_resynced += begin - 1
+            self.synced = True
+        if end < begin:
+            # no complete packets yet, the data can't be a packet if it has grown too large
+            self.tail = data[begin:]
+            if len(self.tail) > PACKET_MAX_RAW_SIZE:
+                self.n_resynced += len(self.tail)
+                self.tail = b''
+                self.synced = False
+            return (np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0))
+        # the last packet may continue in the next block
+        self.tail = data[end + 1:]
+        timestamps, ids, values, n_packets, n_errors = gdat.decode_packets(data[begin:end], self.parameters, self.tables)
+        self.n_packets += n_packets - n_errors
+        self.n_errors += n_errors
+        return (timestamps, ids, values)
+
+# RingBuffer keeps the most recent (timestamp, value) samples of a parameter in a preallocated array
+# one thread writes while others read without locking:
+# the writer announces which samples it's about to write (pending), writes them, and only then increases count
+# readers keep their own position (a count) to read from, and drop samples the writer overwrote while they were copied
+class RingBuffer:
+    def __init__(self, depth: int = RING_DEPTH):
+        self.depth = depth
+        self.data = None # allocated on the first write, most parameters are never received
+        self.count = 0 # number of samples written
+        self.pending = 0 # number of samples written once the current write finishes
+
+    def write(self, timestamps: np.ndarray, values: np.ndarray):
+        if self.data is None:
+            self.data = np.zeros((self.depth, 2))
+        # only the last depth samples would survive
+        timestamps = timestamps[-self.depth:]
+        values = values[-self.depth:]
+        self.pending = self.count + len(timestamps)
+        i = np.arange(self.count, self.pending) % self.depth
+        self.data[i, 0] = timestamps
+        self.data[i, 1] = values
+        self.count = self.pending
+
+    # returns the samples written since position `since` as an (n, 2) array, and the position to read from next
+    # samples that were overwritten before they could be read are skipped
+    def read(self, since: int = 0):
+        count = self.count
+        start = min(max(since, count - self.depth), count)
+        if start == count:
+            return (np.zeros((0, 2)), count)
+        samples = self.data[np.arange(start, count) % self.depth]
+        # the writer may have wrapped around onto the oldest samples while they were copied
+        overwritten = self.pending - self.depth - start
+        if overwritten > 0:
+            samples = samples[overwritten:]
+        return (samples, count)
+
+    # returns the most recent sample as (timestamp, value), or None if nothing has been written
+    def latest(self):
+        count = self.count
+        if count == 0:
+            return None
+        return tuple(self.data[(count - 1) % self.depth].tolist())
+
+# a GopherVision Node decodes received blocks of .gdat data (see telemetry.Hub, which reads them from a port)
+# and keeps a RingBuffer of each parameter's samples, along with each parameter's most recent value
+# timestamps are the device's (ms), t0 is the estimated wall-clock time (s) of device timestamp 0
+# received data can optionally be recorded to .gdat files, which are converted to .ld as they're written (see record.Recorder)
 class Node:
-    def __init__(self):
+    def __init__(self, depth: int = RING_DEPTH):
         self.parameters = {}
+        self.framer = Framer()
+        self.depth = depth
+        self.buffers: dict[int, RingBuffer] = {}
         self.values = {}
-        self.rx_port = Port()
-        self.tx_port = Port()
-        self.record = None
-        self.clients: list[tuple[str, int]] = []
-        threading.Thread(target=self.loop, daemon=True).start()
-
-    def loop(self):
-        while True:
-            if len(self.parameters) == 0:
-                # no parameters to parse data with
-                time.sleep(1)
-                continue
-
-            # attempt to read a block of data
-            try:
-                block = self.rx_port.read(BLOCK_SIZE)
-            except:
-                time.sleep(1)
-                continue
-
-            # split block into packets and update channels
-            packets = block.split(START.to_bytes(1, 'big'))
-            for packet in packets:
-                # unescape packet
-                pkt = bytearray()
-                esc = False
-                for b in packet:
-                    if b == ESC:
-                        esc = True
-                    elif esc:
-                        pkt.append(b ^ ESC_XOR)
-                        esc = False
-                    else:
-                        pkt.append(b)
-                # unpack components
-                try:
-                    timestamp, id = struct.unpack('>IH', pkt[0:6])
-                    value = struct.unpack(self.parameters[id]['format'], pkt[6:-1])[0]
-                except:
-                    continue
-                # validate checksum
-                sum = START
-                for b in pkt[:-1]: sum += b
-                if sum.to_bytes(2, 'big')[-1] != pkt[-1]:
-                    continue
-                # update latest value
-                self.values[id] = value
-
-            # record to .gdat file
-            if self.record is not None:
-                try:
-                    self.record.write(block)
-                except:
-                    self.close_record()
-
-            # forward to clients
-            for host, port in self.clients:
-                try:
-                    self.tx_port.send_to(block, host, port)
-                except:
-                    pass
-
-    def set_parameters(self, parameters: dict):
+        self.t0 = None
+        self.recorder = None
+
+    # decode a block, returns the decoded (timestamps, ids, values) as from Framer.feed
+    def receive(self, block: bytes):
+        if len(self.parameters) == 0:
+            # no parameters to parse data with
+            return (np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0))
+
+        # decode every complete packet at once and update channels
+        timestamps, ids, values = self.framer.feed(block)
+        self.store(timestamps, ids, values)
+
+        # hand off to the recorder's writer thread
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.write(block)
+
+        return (timestamps, ids, values)
+
+    # add samples to the parameters' buffers, samples must be grouped by ID (in time order within each ID)
+    def store(self, timestamps: np.ndarray, ids: np.ndarray, values: np.ndarray):
+        if len(ids) == 0:
+            return
+        self.sync_clock(timestamps.max())
+        # the last sample of each ID is its latest value
+        bounds = (np.flatnonzero(np.diff(ids)) + 1).tolist()
+        buffers = self.buffers
+        for (lo, hi) in zip([0, *bounds], [*bounds, len(ids)]):
+            id = int(ids[lo])
+            if id in buffers:
+                buffers[id].write(timestamps[lo:hi], values[lo:hi])
+            self.values[id] = float(values[hi - 1])
+
+    # estimate t0 from the latest device timestamp (ms)
+    # t0 is only moved if the device clock restarted or drifted, so that plotted samples stay evenly spaced
+    def sync_clock(self, timestamp: float):
+        t0 = time.time() - timestamp / 1000
+        if self.t0 is None or abs(t0 - self.t0) > CLOCK_TOLERANCE:
+            self.t0 = t0
+
+    def set_parameters(self, parameters: dict, depth: int = None):
+        if depth is not None:
+            self.depth = depth
+        self.framer.set_parameters(parameters)
+        self.buffers = {
+            id: RingBuffer(self.depth)
+            for id in parameters.keys()
+        }
         self.parameters = parameters
         self.values = {
             id: 0
             for id in parameters.keys()
         }
 
-    def add_client(self, host: str, port: int):
-        if (host, port) not in self.clients:
-            self.clients.append((host, port))
-
-    def remove_client(self, host: str, port: int):
-        self.clients = list(filter(lambda addr: addr != (host, port), self.clients))
-
     def open_record(self, path: str):
-        self.record = open(path, 'wb')
-        self.record.write(f'/{time.strftime("%Y-%m-%d-%H-%M-%S")}.gdat:\n'.encode())
-    
+        if self.recorder is not None:
+            self.close_record()
+        # the recording is also converted to .ld as it's written, if there are parameters to decode it with
+        parameters = self.parameters if len(self.parameters) > 0 else None
+        self.recorder = record.Recorder(path, parameters=parameters)
+
     def close_record(self):
-        self.record.close()
-        self.record = None
\ No newline at end of file
+        recorder = self.recorder
+        self.recorder = None
+        if recorder is not None:
+            recorder.close()
\ No newline at end of file
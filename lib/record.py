@@ -0,0 +1,328 @@
+import os
+import time
+import threading
+from pathlib import Path
+from collections import deque
+import math
+import numpy as np
+
+from lib import gdat
+from lib import ld
+
+# records received .gdat data to disk without slowing down the receiver
+# the receiver appends blocks to a queue (a deque, which needs no lock), and a writer thread
+# drains it every WRITE_INTERVAL, writing everything queued in one buffered write
+#
+# a session is split into files of at most MAX_FILE_SIZE bytes or MAX_FILE_DURATION seconds:
+#   session.gdat, session_2.gdat, session_3.gdat, ...
+# files are only split at packet boundaries and every file has the session's .gdat header, so each one loads on its own
+# a packet index is built as data is written and saved next to each file (see gdat.save_index),
+# it's refreshed with an fsync every CHECKPOINT_INTERVAL, so a file cut short by a crash loses at most that much data,
+# and the file (even one still being recorded) opens through its index, with only data after the checkpoint to index
+# given the session's parameters, each file is also converted to .ld as it's written (see LdConverter),
+# so session.ld is ready as soon as recording stops instead of after a full conversion
+
+WRITE_INTERVAL = 0.25 # seconds between writes
+CHECKPOINT_INTERVAL = 10 # seconds between fsyncs (and index saves)
+INDEX_GROWTH = 0.25 # fraction an index has to grow by before a checkpoint saves it again
+BUFFER_SIZE = 1024 * 1024 # bytes buffered by each file
+MAX_FILE_SIZE = 64 * 1024 * 1024 # bytes per file
+MAX_FILE_DURATION = 15 * 60 # seconds per file
+LD_INTERVAL = 10 # seconds between .ld snapshots
+
+START = gdat.START.to_bytes(1, 'big')
+
+class Recorder:
+    def __init__(self, path, max_size: int = MAX_FILE_SIZE, max_duration: float = MAX_FILE_DURATION, parameters: dict = None, mode: str = gdat.RESAMPLE_MODE):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.max_duration = max_duration
+        self.parameters = parameters # no .ld conversion if None
+        self.mode = mode
+        self.header = f'/{time.strftime("%Y-%m-%d-%H-%M-%S")}.gdat:\n'.encode()
+        self.converter = None
+        self.queue = deque()
+        self.stopping = threading.Event()
+        self.error = None # set if writing failed, which stops the recording
+        self.paths = [] # every file written so far
+        self.n_bytes = 0 # bytes of data recorded
+        self.file = None
+        self.open_file()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # queue a received block, called from the receiving thread
+    def write(self, block: bytes):
+        if self.error is None:
+            self.queue.append(block)
+
+    # write everything that was queued and stop recording
+    def close(self):
+        self.stopping.set()
+        self.thread.join()
+
+    def part_path(self, n: int) -> Path:
+        if n == 1:
+            return self.path
+        return self.path.with_name(f'{self.path.stem}_{n}{self.path.suffix}')
+
+    def open_file(self):
+        path = self.part_path(len(self.paths) + 1)
+        self.file = open(path, 'wb', buffering=BUFFER_SIZE)
+        self.file.write(self.header)
+        self.paths.append(path)
+        self.opened = time.time()
+        self.size = len(self.header)
+        self.index = gdat.PacketIndex()
+        self.indexed_packets = 0 # packets in the last saved index
+        # data after the last start delimiter, which is indexed once the packet is complete
+        # like gdat.index_packets, the data begins right after ".gdat:"
+        data_start = self.header.index(b'.gdat:') + len(b'.gdat:')
+        self.segment = bytearray(self.header[data_start:])
+        self.segment_pos = data_start
+        if self.parameters is not None:
+            t0 = gdat.get_t0(self.header[:data_start - len(b'.gdat:')])
+            self.converter = LdConverter(path.with_suffix('.ld'), self.parameters, t0, self.mode)
+        print(f'recording to {path}')
+
+    def close_file(self):
+        self.index.add(np.frombuffer(bytes(self.segment), dtype=np.uint8), self.segment_pos)
+        self.file.close()
+        gdat.save_index(self.paths[-1], self.index.index(), self.index.n_packets)
+        self.file = None
+        self.convert(bytes(self.segment), write=True)
+        self.converter = None
+
+    # write data to the current file and index its complete packets
+    def write_file(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+        self.n_bytes += len(data)
+        self.segment += data
+        end = self.segment.rfind(START)
+        if end >= 0:
+            self.index.add(np.frombuffer(bytes(self.segment[:end]), dtype=np.uint8), self.segment_pos)
+            self.convert(bytes(self.segment[:end]))
+            self.segment_pos += end + 1
+            del self.segment[:end + 1]
+
+    # flush and fsync the current file and save the index of its complete packets
+    # the index ends right before the last start delimiter written, so it stays valid as the file grows
+    # (gdat.load_index indexes anything after it when the file is opened)
+    # the whole index is saved each time, so it's only saved once it has grown by INDEX_GROWTH since the last save,
+    # which keeps the total written linear in the file's size while the unindexed part stays a fraction of it
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        n_packets = self.index.n_packets
+        if n_packets > 0 and n_packets >= self.indexed_packets * (1 + INDEX_GROWTH):
+            gdat.save_index(self.paths[-1], self.index.view(), n_packets, size=self.segment_pos - 1)
+            self.indexed_packets = n_packets
+
+    # feed complete packets to the .ld converter, and optionally write a snapshot
+    # a failed conversion is reported and stops converting, but not recording
+    def convert(self, data: bytes, write: bool = False):
+        if self.converter is None:
+            return
+        try:
+            self.converter.feed(data)
+            if write:
+                self.converter.write()
+        except Exception as err:
+            print(f'WARNING: converting {self.paths[-1]} to .ld stopped: {err}')
+            self.converter = None
+
+    def rotate_due(self, n_bytes: int) -> bool:
+        return self.size + n_bytes > self.max_size or time.time() - self.opened > self.max_duration
+
+    def drain(self) -> bytes:
+        blocks = []
+        while True:
+            try:
+                blocks.append(self.queue.popleft())
+            except IndexError:
+                return b''.join(blocks)
+
+    def run(self):
+        last_checkpoint = time.time()
+        last_ld = time.time()
+        while True:
+            stopping = self.stopping.wait(WRITE_INTERVAL)
+            try:
+                data = self.drain()
+                # a large batch can fill several files
+                while len(data) > 0 and self.rotate_due(len(data)):
+                    # split at the last start delimiter that fits, so the next file begins with a whole packet
+                    # a new file has to take at least one packet, so that it isn't left empty
+                    first = 0 if self.size > len(self.header) else 1
+                    room = self.max_size - self.size
+                    end = data.rfind(START, first, room + 1) if room >= 0 else -1
+                    if end < 0:
+                        # no packet boundary fits, the file goes over max_size by a packet
+                        end = data.find(START, first)
+                    if end < 0:
+                        break
+                    self.write_file(data[:end])
+                    self.close_file()
+                    self.open_file()
+                    data = data[end:]
+                    last_checkpoint = time.time()
+                    last_ld = time.time()
+                self.write_file(data)
+                if stopping:
+                    self.close_file()
+                    print(f'recorded {self.n_bytes} bytes to {len(self.paths)} file(s)')
+                    return
+                if time.time() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self.checkpoint()
+                    last_checkpoint = time.time()
+                if time.time() - last_ld >= LD_INTERVAL:
+                    self.convert(b'', write=True)
+                    last_ld = time.time()
+            except Exception as err:
+                self.error = err
+                print(f'ERROR: recording to {self.paths[-1]} stopped: {err}')
+                try:
+                    self.file.close()
+                except Exception:
+                    pass
+                return
+
+# LdConverter converts a .gdat file to .ld as it's written, with the same result as converting the finished file
+# each channel keeps its points, resampled values, and encoded values (see LiveChannel), which are only extended
+# with the points received since the last snapshot instead of converting everything again
+# .ld files store each channel's samples contiguously, so they can't be appended to:
+# every snapshot rewrites the .ld file, to a temporary file that then replaces the previous snapshot
+class LdConverter:
+    def __init__(self, path, parameters: dict, t0, mode: str = gdat.RESAMPLE_MODE):
+        self.path = Path(path)
+        self.parameters = parameters
+        self.tables = gdat.packet_tables(parameters)
+        self.t0 = t0
+        self.mode = mode
+        self.channels: dict[int, LiveChannel] = {}
+
+    # decode complete packets (between start delimiters, as passed to gdat.decode_packets)
+    def feed(self, data: bytes):
+        if len(data) == 0:
+            return
+        timestamps, ids, values, _, _ = gdat.decode_packets(data, self.parameters, self.tables)
+        bounds = (np.flatnonzero(np.diff(ids)) + 1).tolist()
+        for (lo, hi) in zip([0, *bounds], [*bounds, len(ids)]):
+            if lo == hi:
+                continue
+            id = int(ids[lo])
+            if id not in self.channels:
+                self.channels[id] = LiveChannel(id, self.parameters[id])
+            self.channels[id].add(timestamps[lo:hi], values[lo:hi])
+
+    # bring every channel up to date and write a .ld snapshot
+    def write(self):
+        # channels are written in parameter order, like gdat.create_channels
+        channels = [
+            self.channels[id] for id in self.parameters
+            if id in self.channels and self.channels[id].update(self.mode)
+        ]
+        if len(channels) == 0:
+            return
+        temp = self.path.with_name(self.path.name + '.tmp')
+        with ld.Writer(temp, self.t0, len(channels)) as writer:
+            for channel in channels:
+                writer.add_channel(channel.ch, [channel.v_enc.data[:channel.v_enc.size]])
+        os.replace(temp, self.path)
+
+# a channel that is resampled and encoded as its points arrive, see gdat.process_channel
+# points nearly always arrive in time order, which keeps updates cheap:
+#   the sample rate (the most common delta between points, see gdat.set_sample_rate) is kept as a count of each delta
+#   samples before the latest point don't depend on later points, so only samples after it are resampled
+#   samples are only re-encoded if a new value range changes the encoding
+# points that arrive out of order are sorted in and the channel is resampled from the start
+class LiveChannel:
+    def __init__(self, id: int, param: dict):
+        self.ch = gdat.new_channel(id, param, np.empty((0, 2)))
+        self.points = gdat.Buffer((2,))
+        self.delta_counts = np.zeros(101, dtype=np.int64) # deltas from 0 to 100ms
+        self.in_order = True
+        self.v_min = math.inf
+        self.v_max = -math.inf
+        self.v_int = gdat.Buffer()
+        self.v_enc = gdat.Buffer(dtype=np.int32)
+        self.encoded_range = None # (v_min, v_max) the encoding was found for
+        self.encodable = True
+
+    def add(self, timestamps: np.ndarray, values: np.ndarray):
+        if self.points.size > 0:
+            last = self.points.data[self.points.size - 1, 0]
+            deltas = np.diff(timestamps, prepend=last)
+        else:
+            deltas = np.diff(timestamps)
+        if self.in_order and np.all(deltas >= 0):
+            self.count_deltas(deltas)
+        else:
+            self.in_order = False
+        self.points.append(np.column_stack((timestamps, values)))
+        self.v_min = min(self.v_min, values.min())
+        self.v_max = max(self.v_max, values.max())
+
+    def count_deltas(self, deltas: np.ndarray):
+        deltas = deltas[(deltas >= 1) & (deltas <= 100)].astype(np.int64)
+        self.delta_counts += np.bincount(deltas, minlength=len(self.delta_counts))
+
+    # the channel's time delta (ms), as calculated by gdat.set_sample_rate
+    def delta_ms(self) -> int:
+        if self.points.size == 1:
+            return 1000
+        if self.delta_counts.max() == 0:
+            delta = 100
+        else:
+            # the smallest of the most common deltas
+            delta = int(np.argmax(self.delta_counts))
+        while 1000 % delta != 0: delta += 1
+        return delta
+
+    # resample and encode the points received since the last update
+    # returns False if the channel's values can't be encoded
+    def update(self, mode: str = gdat.RESAMPLE_MODE) -> bool:
+        ch = self.ch
+        points = self.points.data[:self.points.size]
+        if not self.in_order:
+            # sort in place, points with equal timestamps stay in the order they were received
+            points[:] = points[np.argsort(points[:,0], kind='stable')]
+            self.delta_counts[:] = 0
+            self.count_deltas(np.diff(points[:,0]))
+            self.in_order = True
+            self.v_int.size = 0
+
+        delta = self.delta_ms()
+        if delta != ch['delta_ms']:
+            self.v_int.size = 0
+        ch['n_points'] = len(points)
+        ch['t_min'] = points[0,0]
+        ch['t_max'] = points[-1,0]
+        ch['delta_ms'] = delta
+        ch['frequency_hz'] = math.trunc(1000 / delta)
+        ch['sample_count'] = math.trunc(ch['t_max'] / delta)
+
+        lo = self.v_int.size
+        if ch['sample_count'] > lo:
+            t = np.arange(lo, ch['sample_count'], dtype=np.float64) * delta
+            # only the points from just before the first new sample are needed
+            first = max(int(np.searchsorted(points[:,0], t[0], side='left')) - 1, 0)
+            self.v_int.append(gdat.resample(points[first:], t, mode))
+
+        if (self.v_min, self.v_max) != self.encoded_range:
+            self.encoded_range = (self.v_min, self.v_max)
+            ch['v_min'], ch['v_max'] = self.encoded_range
+            encoding = (ch['shift'], ch['scalar'], ch['divisor'])
+            self.encodable = gdat.find_encoding(ch)
+            if (ch['shift'], ch['scalar'], ch['divisor']) != encoding:
+                self.v_enc.size = 0
+        if not self.encodable:
+            return False
+        # samples before v_enc.size that were resampled again are re-encoded too
+        self.v_enc.size = min(self.v_enc.size, lo)
+        if self.v_int.size > self.v_enc.size:
+            # resampled values are within the range the encoding was found for, so nothing is clipped
+            encoded, _ = gdat.encode(self.v_int.data[self.v_enc.size:self.v_int.size], ch)
+            self.v_enc.append(encoded)
+        return True
@@ -0,0 +1,498 @@
+import asyncio
+import math
+import threading
+import zlib
+from collections import deque
+import numpy as np
+
+from lib import gdat
+from lib import live
+
+# a telemetry Hub receives .gdat data from a serial port or UDP socket, passes it to a Node for decoding,
+# and fans it out to trackside clients (e.g. pit-wall laptops)
+# everything runs on one asyncio event loop in a background thread, the public methods can be called from any thread
+#
+# clients request data over TCP (CONTROL_PORT) and receive the raw blocks over UDP (DATA_PORT):
+#   client sends "connect" -> hub replies "accepted" and starts forwarding to the client's address
+#   client sends "subscribe IDS [MAX_RATE_HZ]" -> hub replies "subscribed" and only forwards packets of those parameters
+#     e.g. "subscribe 1,2,7" or "subscribe 1,2,7 20" (at most 20 samples/s of each), "subscribe" alone forwards nothing
+#   client sends "subscribe all" -> hub replies "subscribed" and forwards every received block again (the default)
+#   client sends "snapshot IDS RATE_HZ" -> hub replies "subscribed" and sends snapshots of those parameters instead,
+#     e.g. "snapshot 1,2,7 20" (see Snapshots), for links too slow to carry every sample
+#   client sends "close" -> hub replies "closed", forwarding stops when the TCP connection closes
+# subscribed packets are re-framed and batched into datagrams of up to DATAGRAM_SIZE bytes,
+# a partly filled datagram is sent after at most FLUSH_INTERVAL seconds
+# each client has a bounded queue of blocks and its own sender, so a slow client never delays ingest or other clients
+# when a client's queue is full its drop policy applies:
+#   DROP_OLDEST: discard the oldest queued block (keeps the client as current as possible)
+#   DROP_NEWEST: discard the new block
+#   DISCONNECT: stop forwarding to the client
+
+CONTROL_PORT = 5001 # TCP port clients request data on
+DATA_PORT = 5002 # UDP port clients receive data on
+QUEUE_SIZE = 256 # blocks queued for each client before its drop policy applies
+HIGH_WATER = 64 * 1024 # bytes buffered by a client's socket before its sender waits for them to drain
+BACKOFF = 0.01 # seconds a sender waits for its socket to drain
+DATAGRAM_SIZE = 1472 # largest UDP payload that fits in a 1500 byte Ethernet MTU
+FLUSH_INTERVAL = 0.05 # seconds subscribed packets can wait for a datagram to fill
+
+# snapshot datagrams: a header, a bitmap of which subscribed IDs (in ascending order) have an entry, then the entries
+# each entry is a parameter's latest value, how long before the snapshot's timestamp it was received,
+# and the minimum and maximum since the last snapshot as offsets below and above the latest value
+# key identifies the subscribed IDs (see snapshot_key), so snapshots for an old subscription are ignored
+SNAPSHOT_MAGIC = b'GV'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = np.dtype([
+    ('magic', 'S2'),
+    ('version', 'u1'),
+    ('sequence', 'u1'), # counts datagrams, wraps around
+    ('timestamp', '>u4'), # device ms of the latest sample in the snapshot
+    ('interval', '>u2'), # ms between snapshots
+    ('key', '>u2'),
+    ('n_ids', '>u2'),
+])
+SNAPSHOT_ENTRY = np.dtype([
+    ('value', '>f4'),
+    ('age', '>u2'), # ms
+    ('below', '>f2'), # value - min
+    ('above', '>f2'), # max - value
+])
+FLOAT16_MAX = float(np.finfo(np.float16).max)
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+# the parameters a client is subscribed to, and optionally the maximum rate to forward each one at
+class Subscription:
+    def __init__(self, ids, max_rate_hz: float = None):
+        self.ids = np.array(sorted(ids), dtype=np.int64)
+        self.period = 1000 / max_rate_hz if max_rate_hz else None # ms
+        self.last_slot = {} # ID -> time slot (timestamp // period) of the last sample seen
+
+    # parse the arguments of a subscribe request, e.g. "1,2,7 20"
+    @staticmethod
+    def parse(args: str):
+        args = args.split()
+        if len(args) > 2:
+            raise Exception('ERROR: expected "subscribe IDS [MAX_RATE_HZ]"')
+        try:
+            ids = [int(id) for id in args[0].split(',') if id != ''] if len(args) > 0 else []
+            max_rate_hz = float(args[1]) if len(args) > 1 else None
+        except ValueError:
+            raise Exception(f'ERROR: invalid subscription "{" ".join(args)}"')
+        if max_rate_hz is not None and not (math.isfinite(max_rate_hz) and max_rate_hz > 0):
+            raise Exception('ERROR: max rate must be positive')
+        return Subscription(ids, max_rate_hz)
+
+    # indexes of the decoded packets (grouped by ID, see live.Framer.feed) to forward
+    # with a max rate, the first sample in each time slot of 1 / max_rate_hz seconds is forwarded
+    def select(self, timestamps: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        selected = np.flatnonzero(np.isin(ids, self.ids))
+        if self.period is None or len(selected) == 0:
+            return selected
+        ids = ids[selected]
+        slots = np.floor(timestamps[selected] / self.period)
+        first = np.concatenate(([True], ids[1:] != ids[:-1]))
+        last = np.concatenate((first[1:], [True]))
+        # compare each sample's slot to the previous sample of the same ID, possibly from an earlier block
+        previous = np.concatenate(([np.nan], slots[:-1]))
+        previous[first] = [self.last_slot.get(id, np.nan) for id in ids[first].tolist()]
+        self.last_slot.update(zip(ids[last].tolist(), slots[last].tolist()))
+        return selected[slots != previous]
+
+def snapshot_key(ids) -> int:
+    return zlib.crc32(np.asarray(ids, dtype='>u2').tobytes()) & 0xFFFF
+
+# periodic snapshots of a set of parameters: the latest value and the range of values received since the last snapshot
+# only parameters that received samples since the last snapshot are included
+class Snapshots:
+    def __init__(self, ids, rate_hz: float):
+        self.ids = np.array(sorted(set(ids)), dtype=np.int64)
+        self.interval = 1 / rate_hz # s
+        self.key = snapshot_key(self.ids)
+        self.sequence = 0
+        self.reset()
+
+    def reset(self):
+        n = len(self.ids)
+        self.changed = np.zeros(n, dtype=bool)
+        self.value = np.zeros(n)
+        self.time = np.zeros(n)
+        self.min = np.full(n, np.inf)
+        self.max = np.full(n, -np.inf)
+
+    # parse the arguments of a snapshot request, e.g. "1,2,7 20"
+    @staticmethod
+    def parse(args: str):
+        args = args.split()
+        if len(args) != 2:
+            raise Exception('ERROR: expected "snapshot IDS RATE_HZ"')
+        try:
+            ids = [int(id) for id in args[0].split(',') if id != '']
+            rate_hz = float(args[1])
+        except ValueError:
+            raise Exception(f'ERROR: invalid subscription "{" ".join(args)}"')
+        # the interval is sent in ms as a u16
+        if not (math.isfinite(rate_hz) and rate_hz > 0 and 1000 / rate_hz <= 0xFFFF):
+            raise Exception('ERROR: snapshot rate out of range')
+        return Snapshots(ids, rate_hz)
+
+    # add decoded packets (grouped by ID, see live.Framer.feed) to the next snapshot
+    def update(self, timestamps: np.ndarray, ids: np.ndarray, values: np.ndarray):
+        selected = np.flatnonzero(np.isin(ids, self.ids))
+        if len(selected) == 0:
+            return
+        index = np.searchsorted(self.ids, ids[selected])
+        values = values[selected]
+        np.minimum.at(self.min, index, values)
+        np.maximum.at(self.max, index, values)
+        # the last packet of each ID is its latest value
+        last = np.concatenate((index[1:] != index[:-1], [True]))
+        self.value[index[last]] = values[last]
+        self.time[index[last]] = timestamps[selected][last]
+        self.changed[index] = True
+
+    # encode and reset the current snapshot, returns a list of datagrams (empty if nothing changed)
+    def datagrams(self) -> list:
+        changed = np.flatnonzero(self.changed)
+        if len(changed) == 0:
+            return []
+        timestamp = self.time[changed].max()
+        entries = np.empty(len(changed), dtype=SNAPSHOT_ENTRY)
+        entries['value'] = self.value[changed]
+        entries['age'] = np.clip(timestamp - self.time[changed], 0, 0xFFFF)
+        entries['below'] = np.clip(self.value[changed] - self.min[changed], 0, FLOAT16_MAX)
+        entries['above'] = np.clip(self.max[changed] - self.value[changed], 0, FLOAT16_MAX)
+
+        # split entries between datagrams, each with its own bitmap so that it can be decoded alone
+        n_bitmap = (len(self.ids) + 7) // 8
+        per_datagram = max((DATAGRAM_SIZE - SNAPSHOT_HEADER.itemsize - n_bitmap) // SNAPSHOT_ENTRY.itemsize, 1)
+        datagrams = []
+        for lo in range(0, len(changed), per_datagram):
+            header = np.zeros(1, dtype=SNAPSHOT_HEADER)
+            header['magic'] = SNAPSHOT_MAGIC
+            header['version'] = SNAPSHOT_VERSION
+            header['sequence'] = self.sequence
+            header['timestamp'] = timestamp
+            header['interval'] = round(self.interval * 1000)
+            header['key'] = self.key
+            header['n_ids'] = len(self.ids)
+            bitmap = np.zeros(len(self.ids), dtype=bool)
+            bitmap[changed[lo:lo+per_datagram]] = True
+            datagrams.append(header.tobytes() + np.packbits(bitmap).tobytes() + entries[lo:lo+per_datagram].tobytes())
+            self.sequence = (self.sequence + 1) & 0xFF
+        self.reset()
+        return datagrams
+
+# decode a snapshot datagram for the subscribed IDs (in ascending order)
+# returns (timestamps, ids, values, mins, maxs, start), or None if the datagram isn't a snapshot of these IDs
+def decode_snapshot(datagram: bytes, ids: np.ndarray):
+    if len(datagram) < SNAPSHOT_HEADER.itemsize:
+        return None
+    header = np.frombuffer(datagram, dtype=SNAPSHOT_HEADER, count=1)[0]
+    if header['magic'] != SNAPSHOT_MAGIC or header['version'] != SNAPSHOT_VERSION:
+        return None
+    if header['n_ids'] != len(ids) or header['key'] != snapshot_key(ids):
+        return None
+    n_bitmap = (len(ids) + 7) // 8
+    bitmap = np.unpackbits(np.frombuffer(datagram, dtype=np.uint8, count=n_bitmap, offset=SNAPSHOT_HEADER.itemsize), count=len(ids)).astype(bool)
+    n_entries = int(bitmap.sum())
+    if len(datagram) != SNAPSHOT_HEADER.itemsize + n_bitmap + n_entries * SNAPSHOT_ENTRY.itemsize:
+        return None
+    entries = np.frombuffer(datagram, dtype=SNAPSHOT_ENTRY, count=n_entries, offset=SNAPSHOT_HEADER.itemsize + n_bitmap)
+    values = entries['value'].astype(np.float64)
+    timestamps = float(header['timestamp']) - entries['age']
+    mins = values - entries['below']
+    maxs = values + entries['above']
+    # the snapshot covers samples since the previous one
+    start = float(header['timestamp']) - float(header['interval'])
+    return (timestamps, np.asarray(ids)[bitmap], values, mins, maxs, start)
+
+# a client receiving forwarded data on a connected UDP socket
+# disconnect() is called if the client falls behind with the DISCONNECT policy
+class Client:
+    def __init__(self, addr: tuple, transport, queue_size: int = QUEUE_SIZE, policy: str = DROP_OLDEST, disconnect=None):
+        self.addr = addr
+        self.transport = transport
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.policy = policy
+        self.disconnect = disconnect
+        self.subscription = None # forward every block if None, otherwise a Subscription or Snapshots
+        self.pending = bytearray() # subscribed packets waiting for a datagram to fill
+        self.flush_handle = None
+        self.snapshot_task = None
+        self.ready = asyncio.Event()
+        self.n_sent = 0
+        self.n_dropped = 0
+        self.task = asyncio.get_running_loop().create_task(self.send())
+
+    # queue a datagram to send
+    def push(self, datagram: bytes):
+        if len(self.queue) >= self.queue_size:
+            self.n_dropped += 1
+            if self.policy == DISCONNECT:
+                print(f'client {self.addr[0]}:{self.addr[1]} fell behind, disconnecting')
+                if self.disconnect is not None:
+                    self.disconnect(self.addr)
+                return
+            if self.policy == DROP_NEWEST:
+                return
+            self.queue.popleft()
+        self.queue.append(datagram)
+        self.ready.set()
+
+    # add framed packets to the pending datagram, queueing every datagram that fills up
+    def push_packets(self, packets: bytes):
+        self.pending += packets
+        while len(self.pending) >= DATAGRAM_SIZE:
+            # split before the last start delimiter that fits, so packets never span datagrams
+            end = self.pending.rfind(gdat.START, 1, DATAGRAM_SIZE + 1)
+            if end <= 0:
+                end = DATAGRAM_SIZE
+            self.push(bytes(self.pending[:end]))
+            del self.pending[:end]
+        if len(self.pending) > 0 and self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        if len(self.pending) > 0:
+            self.push(bytes(self.pending))
+            self.pending.clear()
+
+    async def send(self):
+        while True:
+            await self.ready.wait()
+            while len(self.queue) > 0:
+                # backpressure: let the queue fill (and the drop policy apply) until the socket drains
+                while self.transport.get_write_buffer_size() > HIGH_WATER:
+                    await asyncio.sleep(BACKOFF)
+                self.transport.sendto(self.queue.popleft())
+                self.n_sent += 1
+            self.ready.clear()
+
+    def subscribe(self, subscription):
+        self.flush()
+        if self.snapshot_task is not None:
+            self.snapshot_task.cancel()
+            self.snapshot_task = None
+        self.subscription = subscription
+        if isinstance(subscription, Snapshots):
+            self.snapshot_task = asyncio.get_running_loop().create_task(self.send_snapshots(subscription))
+
+    async def send_snapshots(self, snapshots: Snapshots):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            deadline += snapshots.interval
+            await asyncio.sleep(max(deadline - loop.time(), 0))
+            for datagram in snapshots.datagrams():
+                self.push(datagram)
+
+    def close(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        if self.snapshot_task is not None:
+            self.snapshot_task.cancel()
+        self.task.cancel()
+        self.transport.close()
+
+# receives blocks on a bound UDP socket
+class Receiver(asyncio.DatagramProtocol):
+    def __init__(self, hub):
+        self.hub = hub
+
+    def datagram_received(self, data, addr):
+        if self.hub.snapshot_ids is not None:
+            self.hub.ingest_snapshot(data)
+        else:
+            self.hub.ingest(data)
+
+class Hub:
+    def __init__(self, node: live.Node, queue_size: int = QUEUE_SIZE, policy: str = DROP_OLDEST):
+        if policy not in POLICIES:
+            raise Exception(f'ERROR: unknown drop policy "{policy}", expected one of {POLICIES}')
+        self.node = node
+        self.queue_size = queue_size
+        self.policy = policy
+        self.clients: dict[tuple[str, int], Client] = {}
+        self.rx_port = None # open serial port (live.Port) or UDP transport
+        self.rx_task = None # task reading from a serial port
+        self.server = None
+        self.snapshot_ids = None # IDs of the snapshots received on a bound UDP socket, None to receive .gdat data
+        self.n_snapshot_errors = 0
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    # run a coroutine on the hub's event loop and wait for its result
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    # INGEST ===================================================================
+
+    # decode a received block and forward it (or the packets they subscribed to) to every client
+    def ingest(self, block: bytes):
+        (timestamps, ids, values) = self.node.receive(block)
+        for client in list(self.clients.values()):
+            if client.subscription is None:
+                client.push(block)
+                continue
+            if isinstance(client.subscription, Snapshots):
+                client.subscription.update(timestamps, ids, values)
+                continue
+            selected = client.subscription.select(timestamps, ids)
+            if len(selected) > 0:
+                packets = gdat.encode_packets(timestamps[selected], ids[selected], values[selected], self.node.framer.tables)
+                client.push_packets(packets.tobytes())
+
+    # store the samples in a snapshot received from another hub
+    # the range of values since the previous snapshot is stored as its minimum and maximum,
+    # halfway between the previous snapshot and the latest value, so plots keep the envelope of the signal
+    def ingest_snapshot(self, datagram: bytes):
+        decoded = decode_snapshot(datagram, self.snapshot_ids)
+        if decoded is None:
+            self.n_snapshot_errors += 1
+            return
+        (timestamps, ids, values, mins, maxs, start) = decoded
+        envelope = (mins < values) | (maxs > values)
+        t = np.minimum((start + timestamps) / 2, timestamps)
+        points = np.column_stack((t, mins, t, maxs, timestamps, values)).reshape(-1, 3, 2)
+        keep = np.column_stack((envelope, envelope, np.ones(len(ids), dtype=bool)))
+        points = points[keep]
+        self.node.store(points[:, 0], np.repeat(ids, keep.sum(axis=1)), points[:, 1])
+
+    # receive snapshots of ids (see Snapshots) on the bound UDP socket, or .gdat data if ids is None
+    def receive_snapshots(self, ids=None):
+        self.snapshot_ids = None if ids is None else np.array(sorted(set(ids)), dtype=np.int64)
+
+    async def read_serial(self, port: live.Port):
+        loop = asyncio.get_running_loop()
+        while True:
+            # serial reads block, so they run in a worker thread
+            try:
+                block = await loop.run_in_executor(None, port.read, live.BLOCK_SIZE)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(1)
+                continue
+            if len(block) > 0:
+                self.ingest(block)
+
+    async def close_rx(self):
+        if self.rx_task is not None:
+            self.rx_task.cancel()
+            self.rx_task = None
+        if self.rx_port is not None:
+            self.rx_port.close()
+            self.rx_port = None
+
+    async def start_serial(self, name: str):
+        await self.close_rx()
+        port = live.Port()
+        port.open_serial(name)
+        self.rx_port = port
+        self.rx_task = asyncio.get_running_loop().create_task(self.read_serial(port))
+
+    async def start_socket(self, host: str, port: int):
+        await self.close_rx()
+        try:
+            (self.rx_port, _) = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: Receiver(self), local_addr=(host, int(port)))
+            print(f'opened port: {host}:{port}')
+        except:
+            print(f'ERROR: failed to open socket on "{host}:{port}"')
+            raise
+
+    # receive data from a serial port
+    def open_serial(self, name: str):
+        self.call(self.start_serial(name))
+
+    # receive data on a UDP socket bound to host:port
+    def bind_socket(self, host: str = '127.0.0.1', port: int = 5000):
+        self.call(self.start_socket(host, port))
+
+    def close_port(self):
+        self.call(self.close_rx())
+
+    # CLIENTS ==================================================================
+
+    async def connect(self, host: str, port: int = DATA_PORT):
+        addr = (host, int(port))
+        if addr in self.clients:
+            return
+        (transport, _) = await asyncio.get_running_loop().create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=addr)
+        self.clients[addr] = Client(addr, transport, self.queue_size, self.policy, self.disconnect)
+        print(f'now sending to: {list(self.clients)}')
+
+    def disconnect(self, addr: tuple):
+        client = self.clients.pop(addr, None)
+        if client is not None:
+            client.close()
+            print(f'now sending to: {list(self.clients)}')
+
+    async def handle_control(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        (host, port) = writer.get_extra_info('peername')[:2]
+        print(f'got connection from {host}:{port}')
+        try:
+            while True:
+                request = (await reader.read(1024)).decode('utf-8')
+                if request == '':
+                    break
+                if request.lower() == 'close':
+                    writer.write('closed'.encode('utf-8'))
+                    await writer.drain()
+                    break
+                print(f'received: {request}')
+                await self.connect(host, DATA_PORT)
+                (command, _, args) = request.strip().partition(' ')
+                if command.lower() in ('subscribe', 'snapshot'):
+                    try:
+                        self.subscribe((host, DATA_PORT), args, command.lower() == 'snapshot')
+                        writer.write('subscribed'.encode('utf-8'))
+                    except Exception as e:
+                        writer.write(str(e).encode('utf-8'))
+                else:
+                    writer.write('accepted'.encode('utf-8'))
+                await writer.drain()
+        except Exception as e:
+            print(f'error handling client: {e}')
+        finally:
+            writer.close()
+            print(f'connection to client ({host}:{port}) closed')
+            self.disconnect((host, DATA_PORT))
+
+    # subscribe a client to the packets described by args (see Subscription.parse), or to every block if args is "all"
+    # with snapshot, the client is sent snapshots instead (see Snapshots.parse)
+    def subscribe(self, addr: tuple, args: str, snapshot: bool = False):
+        client = self.clients[addr]
+        if snapshot:
+            client.subscribe(Snapshots.parse(args))
+        elif args.strip().lower() == 'all':
+            client.subscribe(None)
+        else:
+            client.subscribe(Subscription.parse(args))
+        print(f'{addr[0]}:{addr[1]} subscribed to {"snapshots of " if snapshot else ""}{args.strip() or "nothing"}')
+
+    async def start_server(self, host: str, port: int):
+        self.server = await asyncio.start_server(self.handle_control, host, port)
+        print(f'listening for connection requests on port {port}')
+
+    # accept client connection requests on CONTROL_PORT
+    def serve(self, host: str = '', port: int = CONTROL_PORT):
+        self.call(self.start_server(host, port))
+
+    # forward data to host:port without a control connection
+    def add_client(self, host: str, port: int = DATA_PORT):
+        self.call(self.connect(host, port))
+
+    def remove_client(self, host: str, port: int = DATA_PORT):
+        self.loop.call_soon_threadsafe(self.disconnect, (host, int(port)))
+
+    # returns {(host, port): (queued, sent, dropped)} for each client
+    def stats(self) -> dict:
+        return {addr: (len(c.queue), c.n_sent, c.n_dropped) for (addr, c) in list(self.clients.items())}
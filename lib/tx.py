@@ -69,11 +69,11 @@ def generate_packet():
         data = random.uniform(-100, 100)
     else:
         if parameters[id]['signed']:
-            min = -(2 ^ ((parameters[id]['size'] * 8) - 1))
-            max = 2 ^ ((parameters[id]['size'] * 8) - 1) - 1
+            min = -(2 ** ((parameters[id]['size'] * 8) - 1))
+            max = 2 ** ((parameters[id]['size'] * 8) - 1) - 1
         else:
             min = 0
-            max = 2 ^ (parameters[id]['size'] * 8) - 1
+            max = 2 ** (parameters[id]['size'] * 8) - 1
         data = random.randint(min, max)
 
     packet = START.to_bytes(1, 'big') + struct.pack('>I', timestamp) + struct.pack('>H', id) + struct.pack(parameters[id]['format'], data)
@@ -0,0 +1,49 @@
+import numpy as np
+
+from lib import cache
+from lib import gdat
+
+PARAMETERS = {
+    1: {'id': 1, 'name': 'Engine RPM', 'unit': 'rpm', 'type': 'UNSIGNED16', 'size': 2, 'format': '>H'},
+    2: {'id': 2, 'name': 'Engine Temp', 'unit': 'C', 'type': 'FLOATING', 'size': 4, 'format': '>f'},
+}
+
+def write_gdat(path, n):
+    timestamps = np.arange(n, dtype=np.float64)
+    ids = np.resize([1, 2], n)
+    values = np.resize([0x7E7D, 125.0, 3000, 0.5], n)
+    data = bytes(gdat.encode_packets(timestamps, ids, values, gdat.packet_tables(PARAMETERS)))
+    path.write_bytes(b'/2024-05-01-12-30-00.gdat:\n' + data)
+
+# the CLI opens files through GdatFile: the first open caches the decoded points, the second is served from the cache
+def test_gdat_file_reopens_from_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', tmp_path / 'cache')
+    path = tmp_path / 'session.gdat'
+    write_gdat(path, 1000)
+
+    first = gdat.GdatFile(path, PARAMETERS)
+    assert not first.cached
+    second = gdat.GdatFile(path, PARAMETERS)
+    assert second.cached
+    assert second.n_packets == first.n_packets
+    for id in PARAMETERS:
+        assert np.array_equal(second.channel(id)['v_enc'], first.channel(id)['v_enc'])
+
+    # the entry is shared with gdat.load, and holds the same points as decoding the file
+    (t0, points, n_packets, n_errors) = cache.load(path, PARAMETERS)
+    (t0_read, points_read, n_packets_read, n_errors_read) = gdat.read(path, PARAMETERS)
+    assert (t0, n_packets, n_errors) == (t0_read, n_packets_read, n_errors_read)
+    assert points.keys() == points_read.keys()
+    for id in points:
+        assert np.array_equal(points[id], points_read[id])
+
+# a changed file isn't served from its old cache entry
+def test_changed_file_is_decoded_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_DIR', tmp_path / 'cache')
+    path = tmp_path / 'session.gdat'
+    write_gdat(path, 1000)
+    gdat.GdatFile(path, PARAMETERS)
+    write_gdat(path, 1200)
+    reopened = gdat.GdatFile(path, PARAMETERS)
+    assert not reopened.cached
+    assert reopened.channel(1)['n_points'] == 600
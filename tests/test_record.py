@@ -0,0 +1,89 @@
+import time
+import numpy as np
+
+from lib import gdat
+from lib import record
+
+PARAMETERS = {
+    1: {'id': 1, 'name': 'Engine RPM', 'unit': 'rpm', 'type': 'UNSIGNED16', 'size': 2, 'format': '>H'},
+    2: {'id': 2, 'name': 'Engine Temp', 'unit': 'C', 'type': 'FLOATING', 'size': 4, 'format': '>f'},
+}
+
+# framed packets alternating between the parameters, with values that need escaping
+def packets(n):
+    timestamps = np.arange(n, dtype=np.float64)
+    ids = np.resize([1, 2], n)
+    values = np.resize([0x7E7D, 125.0, 3000, 0.5], n)
+    return bytes(gdat.encode_packets(timestamps, ids, values, gdat.packet_tables(PARAMETERS)))
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise TimeoutError
+        time.sleep(0.05)
+
+def assert_index_equal(indexed, expected):
+    (index, n_packets) = indexed
+    (expected_index, expected_n_packets) = expected
+    assert n_packets == expected_n_packets
+    assert index.keys() == expected_index.keys()
+    for id in expected_index:
+        assert np.array_equal(index[id][0], expected_index[id][0])
+        assert np.array_equal(index[id][1], expected_index[id][1])
+
+def full_index(path):
+    data = np.fromfile(path, dtype=np.uint8)
+    start = bytes(data[:100]).find(b'.gdat:') + len(b'.gdat:')
+    return gdat.index_packets(data, start, len(data))
+
+# a recording cut short by a crash opens through the index saved at its last checkpoint
+def test_truncated_recording_loads_through_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(record, 'CHECKPOINT_INTERVAL', 0)
+    path = tmp_path / 'session.gdat'
+    idx_path = gdat.index_path(path)
+    data = packets(2000)
+    recorder = record.Recorder(path)
+    recorder.write(data[:len(data) // 2])
+    wait_for(idx_path.is_file)
+    checkpoint = idx_path.read_bytes()
+    # the file grows after the checkpoint, and is still opened through its index
+    recorder.write(data[len(data) // 2:len(data) * 3 // 4])
+    wait_for(lambda: recorder.n_bytes == len(data) * 3 // 4)
+    idx_path.write_bytes(checkpoint)
+    assert_index_equal(gdat.load_index(path), full_index(path))
+    recorder.close()
+
+    # crash: the file is cut off in the middle of a packet and the last checkpoint's index is left behind
+    size = path.stat().st_size
+    with open(path, 'r+b') as f:
+        f.truncate(size - len(data) // 8 - 3)
+    idx_path.write_bytes(checkpoint)
+    assert_index_equal(gdat.load_index(path), full_index(path))
+
+    gdat_file = gdat.GdatFile(path, PARAMETERS, use_cache=False)
+    assert gdat_file.n_packets == full_index(path)[1]
+    assert gdat_file.channel(1)['n_points'] > 0
+
+# an index isn't used once the data it covers has changed
+def test_stale_index_is_ignored(tmp_path):
+    path = tmp_path / 'session.gdat'
+    data = packets(200)
+    path.write_bytes(b'/2024-05-01-12-30-00.gdat:\n' + data)
+    gdat.save_index(path, *full_index(path))
+    assert_index_equal(gdat.load_index(path), full_index(path))
+    path.write_bytes(b'/2024-05-01-12-30-00.gdat:\n' + packets(100) + data)
+    assert gdat.load_index(path) is None
+
+# an index left partially written (e.g. by a crash while saving it) is rebuilt instead of failing to load
+def test_corrupt_index_is_rebuilt(tmp_path):
+    path = tmp_path / 'session.gdat'
+    path.write_bytes(b'/2024-05-01-12-30-00.gdat:\n' + packets(200))
+    gdat.save_index(path, *full_index(path))
+    idx_path = gdat.index_path(path)
+    saved = idx_path.read_bytes()
+    for corrupt in (saved[:len(saved) // 2], saved[:10], b''):
+        idx_path.write_bytes(corrupt)
+        assert gdat.load_index(path) is None
+        gdat_file = gdat.GdatFile(path, PARAMETERS, use_cache=False)
+        assert gdat_file.n_packets == full_index(path)[1]
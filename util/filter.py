@@ -1,21 +1,24 @@
 import sys
 from pathlib import Path
-import struct
 import time
+import numpy as np
 
-# python filter.py [INPUT].gdat [OUTPUT].gdat [IDs]
+sys.path.append('../')
+from lib import gdat
+sys.path.pop()
+
+# python filter.py [INPUT].gdat [OUTPUT].gdat [IDs] [--save-index]
 # e.g. python filter.py data.gdat enginerpm.gdat 1
 # e.g. python filter.py data.gdat temps.gdat 2,4,7
 # copies packets with an ID in [IDs] from [INPUT] to [OUTPUT]
 # IDs are separated by *only* a comma
-
-START = 0x7E
-ESC = 0x7D
-ESC_XOR = 0x20
+# if [INPUT].gdat.idx exists (see gdat.save_index), packets are copied straight from the index
+# --save-index saves an index of [INPUT] so that later filters can skip scanning it
 
 ipath = Path(sys.argv[1])
 opath = Path(sys.argv[2])
 filter_ids = [int(id) for id in sys.argv[3].split(',')]
+save_index = '--save-index' in sys.argv[4:]
 
 if ipath.suffix != '.gdat':
     raise Exception('ERROR: input must be a .gdat file')
@@ -26,56 +29,94 @@ if opath.suffix != '.gdat':
 if len(filter_ids) == 0:
     raise Exception('ERROR: please specify IDs to filter')
 
-start = time.time()
+CHUNK_SIZE = gdat.CHUNK_SIZE # bytes of [INPUT] to filter at a time
+BATCH_SIZE = 1024 * 1024 # indexed packets to copy at a time
 
-print(f'loading {ipath} ...')
-(sof, ext, data) = ipath.read_bytes().partition(b'.gdat:')
-print(f'read {len(data)} bytes of data')
+start = time.time()
 
 if opath.is_file():
     opath.unlink()
 
+print(f'loading {ipath} ...')
+if ipath.stat().st_size > 0:
+    data = np.memmap(ipath, dtype=np.uint8, mode='r')
+else:
+    data = np.zeros(0, dtype=np.uint8)
+(sof, ext, _) = bytes(data[:CHUNK_SIZE]).partition(b'.gdat:')
+data_start = len(sof) + len(ext) if ext else len(data)
+
 print('filtering data...')
 
 # copy metadata
 ofile = open(opath, 'wb')
 ofile.write(bytes(sof + ext))
 
-# filter packets
-packets = data.split(START.to_bytes())
+n_bytes = len(data) - data_start
+n_packets = 0
 n_errors = 0
 n_copied = 0
-for packet in packets:
-    # unescape packet
-    pkt = bytearray()
-    esc = False
-    for b in packet:
-        if b == ESC:
-            esc = True
-        elif esc:
-            pkt.append(b ^ ESC_XOR)
-            esc = False
-        else:
-            pkt.append(b)
-    # unpack components
-    try:
-        ts, id = struct.unpack('>IH', pkt[0:6])
-    except:
-        n_errors += 1
-        continue
-    # validate checksum
-    sum = START
-    for b in pkt[:-1]: sum += b
-    if sum.to_bytes(2)[-1] != pkt[-1]:
-        n_errors += 1
-        continue
-    # check if id is whitelisted
-    if id in filter_ids:
-        # copy to output file
-        ofile.write(START.to_bytes() + packet)
-        n_copied += 1
-
-print(f'{len(packets)} packets, {n_errors} errors, {n_copied} copied')
+indexed = gdat.load_index(ipath)
+if indexed is not None:
+    # copy indexed packets with a matching ID in file order, checking checksums as they're copied
+    print(f'using index {gdat.index_path(ipath)}')
+    index, n_packets = indexed
+    selected = [index[id] for id in set(filter_ids) if id in index]
+    offsets = np.concatenate([o for (o, _) in selected] or [np.zeros(0, np.int64)])
+    raw_lengths = np.concatenate([r for (_, r) in selected] or [np.zeros(0, np.uint16)])
+    order = np.argsort(offsets)
+    offsets = offsets[order]
+    raw_lengths = raw_lengths[order]
+    for lo in range(0, len(offsets), BATCH_SIZE):
+        batch_offsets = offsets[lo:lo+BATCH_SIZE]
+        batch_lengths = raw_lengths[lo:lo+BATCH_SIZE]
+        packets, first, _, lengths = gdat.split_packets(gdat.gather_packets(data, batch_offsets, batch_lengths)[1:])
+        valid = gdat.checksums_valid(packets, first, lengths)
+        n_errors += int((~valid).sum())
+        n_copied += int(valid.sum())
+        gdat.gather_packets(data, batch_offsets[valid], batch_lengths[valid]).tofile(ofile)
+else:
+    # scan the input in chunks, finding packet boundaries and IDs without decoding each packet
+    pos = data_start
+    end = len(data)
+    n_bytes = 0
+    while True:
+        # only filter up to the last start delimiter, the final packet may continue in the next chunk
+        # the delimiter itself is skipped, matching how bytes.split(START) counts packets
+        size = CHUNK_SIZE
+        while True:
+            if pos + size >= end:
+                (seg_end, next_pos) = (end, None)
+                break
+            i = np.flatnonzero(data[pos:pos+size] == gdat.START)
+            if len(i) > 0:
+                (seg_end, next_pos) = (pos + i[-1], pos + i[-1] + 1)
+                break
+            size *= 2
+        packets, first, raw_lengths, lengths = gdat.split_packets(np.asarray(data[pos:seg_end]))
+        n_bytes += seg_end - pos
+        n_packets += len(first)
+        # packets need a timestamp, id, and valid checksum
+        candidates, ids = gdat.packet_ids(packets, first, lengths)
+        valid = gdat.checksums_valid(packets, first[candidates], lengths[candidates])
+        n_errors += len(first) - int(valid.sum())
+        # copy matching packets in one write
+        copy = candidates[valid & np.isin(ids, filter_ids)]
+        n_copied += len(copy)
+        gdat.gather_packets(data, first[copy] + pos, raw_lengths[copy]).tofile(ofile)
+        if next_pos is None:
+            break
+        pos = next_pos
+    if save_index:
+        gdat.save_index(ipath, *gdat.index_packets(data, data_start, len(data), CHUNK_SIZE))
+        print(f'saved index to {gdat.index_path(ipath)}')
+
+ofile.close()
+
+print(f'read {n_bytes} bytes of data')
+if indexed is not None:
+    print(f'{n_packets} packets indexed, {n_errors} errors in the selected packets, {n_copied} copied')
+else:
+    print(f'{n_packets} packets, {n_errors} errors, {n_copied} copied')
 
 elapsed = round(time.time() - start, 2)
-print(f'finished in ({elapsed}s)')
\ No newline at end of file
+print(f'finished in ({elapsed}s)')
@@ -9,7 +9,6 @@
 
 import sys
 import serial
-import struct
 import socket
 from pathlib import Path
 from collections import deque
@@ -18,16 +17,13 @@ import threading
 
 sys.path.append('../')
 from lib import gcan
+from lib import live
 sys.path.pop()
 
 if len(sys.argv) != 3:
     print('invalid arguments, expected "python live-plot.py [PORT]"')
     exit()
 
-START = 0x7E
-ESC = 0x7D
-ESC_XOR = 0x20
-
 PORT = sys.argv[1]
 BAUD = 230400
 
@@ -72,6 +68,7 @@ channels = {
 }
 
 def rx():
+    framer = live.Framer(parameters)
     print(f'listening on port "{PORT}"...')
     while True:
         if PORT_TYPE == 'serial':
@@ -79,33 +76,10 @@ def rx():
         elif PORT_TYPE == 'socket':
             bytes = port.recv(BLOCK_SIZE)
 
-        packets = bytes.split(START.to_bytes(1, 'big'))
-        for packet in packets:
-            # unescape packet
-            pkt = bytearray()
-            esc = False
-            for b in packet:
-                if b == ESC:
-                    esc = True
-                elif esc:
-                    pkt.append(b ^ ESC_XOR)
-                    esc = False
-                else:
-                    pkt.append(b)
-            # unpack components
-            try:
-                ts, id = struct.unpack('>IH', pkt[0:6])
-                value = struct.unpack(parameters[id]['format'], pkt[6:-1])[0]
-            except:
-                # print(f'failed to decode: {packet}')
-                continue
-            # validate checksum
-            sum = START
-            for b in pkt[:-1]: sum += b
-            if sum.to_bytes(2, 'big')[-1] != pkt[-1]:
-                # print(f'invalid checksum: {packet}')
-                continue
-            # add datapoint to channel
+        # decode complete packets, packets split across blocks are reassembled by the framer
+        timestamps, ids, values = framer.feed(bytes)
+        # add datapoints to channels
+        for (ts, id, value) in zip(timestamps.tolist(), ids.tolist(), values.tolist()):
             channels[id]['x'].append(ts)
             channels[id]['y'].append(value)
 
@@ -1,11 +1,13 @@
 import sys
 import serial
-import struct
 import socket
+import time
 from pathlib import Path
+import numpy as np
 
 sys.path.append('../')
 from lib import gcan
+from lib import live
 sys.path.pop()
 
 # python rx.py [PORT] [CONFIG_NAME]
@@ -15,15 +17,12 @@ sys.path.pop()
 # e.g. python rx.py 5000 go4-24c.yaml
 # opens the specified serial or network port, expecting to receive .gdat packets
 # parses packets using the provided GopherCAN config and prints to the terminal
+# link statistics (throughput, decoded packets, errors, resynced bytes) are printed every STATS_INTERVAL seconds
 
 if len(sys.argv) != 3:
     print('invalid arguments, expected "python rx.py [PORT] [CONFIG_NAME]"')
     exit()
 
-START = 0x7E
-ESC = 0x7D
-ESC_XOR = 0x20
-
 PORT = sys.argv[1]
 BAUD = 230400
 
@@ -31,6 +30,7 @@ CONFIG_NAME = sys.argv[2]
 
 BLOCK_SIZE = 1000 # bytes to read in each update
 TIMEOUT = 1 # seconds to wait for desired block size
+STATS_INTERVAL = 1 # seconds between link statistics
 
 PORT_TYPE = ''
 try:
@@ -57,6 +57,9 @@ except:
 parameters = gcan.get_params(config)
 pids = list(parameters.keys())
 
+framer = live.Framer(parameters)
+last_stats = (time.time(), 0, 0)
+
 print(f'listening on port "{PORT}"...')
 while True:
     if PORT_TYPE == 'serial':
@@ -64,31 +67,18 @@ while True:
     elif PORT_TYPE == 'socket':
         bytes = port.recv(BLOCK_SIZE)
 
-    packets = bytes.split(START.to_bytes(1, 'big'))
-    for packet in packets:
-        # unescape packet
-        pkt = bytearray()
-        esc = False
-        for b in packet:
-            if b == ESC:
-                esc = True
-            elif esc:
-                pkt.append(b ^ ESC_XOR)
-                esc = False
-            else:
-                pkt.append(b)
-        # unpack components
-        try:
-            ts, id = struct.unpack('>IH', pkt[0:6])
-            value = struct.unpack(parameters[id]['format'], pkt[6:-1])[0]
-        except:
-            # print(f'failed to decode: {packet}')
-            continue
-        # validate checksum
-        sum = START
-        for b in pkt[:-1]: sum += b
-        if sum.to_bytes(2, 'big')[-1] != pkt[-1]:
-            # print(f'invalid checksum: {packet}')
-            continue
-        # print packet info
-        print(f'timestamp={ts} id={id} data={value}')
\ No newline at end of file
+    # decode complete packets, packets split across blocks are reassembled by the framer
+    timestamps, ids, values = framer.feed(bytes)
+    # print packet info in the order packets were sent
+    for i in np.argsort(timestamps, kind='stable'):
+        print(f'timestamp={int(timestamps[i])} id={ids[i]} data={values[i]}')
+
+    # print link statistics
+    (t, n_bytes, n_packets) = last_stats
+    now = time.time()
+    if now - t >= STATS_INTERVAL:
+        print(
+            f'{(framer.n_bytes - n_bytes) / (now - t):.0f} B/s, {(framer.n_packets - n_packets) / (now - t):.0f} packets/s, '
+            f'{framer.n_packets} packets, {framer.n_errors} errors, {framer.n_resynced} bytes resynced'
+        )
+        last_stats = (now, framer.n_bytes, framer.n_packets)